@@ -9,12 +9,16 @@ import asyncio
 import whisper_timestamped as whisper
 from utility.script.script_generator import generate_script
 from utility.audio.audio_generator import generate_audio
-from utility.captions.timed_captions_generator import generate_timed_captions
-from utility.video.background_video_generator import generate_video_url
+from utility.captions.timed_captions_generator import generate_timed_captions, get_default_device, faster_whisper_available
+from utility.captions.cache import get_or_compute
+from utility.audio.vad import trim_silence, restore_caption_times
+from utility.video.background_video_generator import generate_video_url_async
 from utility.render.render_engine import get_output_media
-from utility.video.video_search_query_generator import getVideoSearchQueriesTimed, merge_empty_intervals
+from utility.video.video_search_query_generator import getVideoSearchQueriesTimed, merge_empty_intervals, FallbackSearchTerms
 import argparse
+import logging
 import sys
+import tempfile
 
 # Robust audio generation function with retry logic
 async def robust_audio_generation(text, filename, max_retries=3):
@@ -23,9 +27,9 @@ async def robust_audio_generation(text, filename, max_retries=3):
     for attempt in range(max_retries):
         try:
             print(f"Audio generation attempt {attempt + 1}/{max_retries}...")
-            await asyncio.wait_for(generate_audio(text, filename), timeout=60)
+            audio_file = await asyncio.wait_for(generate_audio(text, filename), timeout=60)
             print("Audio generated successfully!")
-            return True
+            return audio_file
             
         except asyncio.TimeoutError:
             print(f"Attempt {attempt + 1} timed out after 60 seconds")
@@ -42,7 +46,7 @@ async def robust_audio_generation(text, filename, max_retries=3):
                 await asyncio.sleep(wait_time)
     
     print("All audio generation attempts failed")
-    return False
+    return None
 
 # Alternative audio generation using different approach
 async def fallback_audio_generation(text, filename):
@@ -55,7 +59,7 @@ async def fallback_audio_generation(text, filename):
         await asyncio.wait_for(communicate.save(filename), timeout=45)
         
         print("Fallback audio generation successful!")
-        return True
+        return filename
         
     except Exception as e:
         print(f"Fallback audio generation failed: {e}")
@@ -66,40 +70,26 @@ async def fallback_audio_generation(text, filename):
             print("Trying gTTS as final fallback...")
             
             tts = gTTS(text=text, lang='en', slow=False)
-            # Convert mp3 to wav if needed
-            if filename.endswith('.wav'):
-                temp_file = filename.replace('.wav', '_temp.mp3')
-                tts.save(temp_file)
-                
-                # Convert mp3 to wav using pydub
-                try:
-                    from pydub import AudioSegment
-                    audio = AudioSegment.from_mp3(temp_file)
-                    audio.export(filename, format="wav")
-                    os.remove(temp_file)
-                    print("gTTS generation successful!")
-                    return True
-                except ImportError:
-                    print("pydub not installed, saving as mp3")
-                    os.rename(temp_file, filename.replace('.wav', '.mp3'))
-                    return True
-            else:
-                tts.save(filename)
-                print("gTTS generation successful!")
-                return True
+            # Whisper reads mp3 directly, so keep gTTS's mp3 as is
+            mp3_filename = os.path.splitext(filename)[0] + '.mp3'
+            tts.save(mp3_filename)
+            print("gTTS generation successful!")
+            return mp3_filename
                 
         except ImportError:
             print("gTTS not available. Install with: pip install gtts")
         except Exception as gtts_error:
             print(f"gTTS failed: {gtts_error}")
     
-    return False
+    return None
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate a video from a topic.")
     parser.add_argument("topic", type=str, help="The topic for the video")
 
     args = parser.parse_args()
+    # Caption debug output is off unless LOG_LEVEL=DEBUG
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
     SAMPLE_TOPIC = args.topic
     SAMPLE_FILE_NAME = "audio_tts.wav"
     VIDEO_SERVER = "pexel"
@@ -119,44 +109,63 @@ if __name__ == "__main__":
     # Step 2: Generate Audio with robust error handling
     async def audio_pipeline():
         # Try main audio generation
-        success = await robust_audio_generation(response, SAMPLE_FILE_NAME)
+        audio_file = await robust_audio_generation(response, SAMPLE_FILE_NAME)
         
-        if not success:
+        if not audio_file:
             print("Trying fallback methods...")
-            success = await fallback_audio_generation(response, SAMPLE_FILE_NAME)
+            audio_file = await fallback_audio_generation(response, SAMPLE_FILE_NAME)
         
-        if not success:
+        if not audio_file:
             print("All audio generation methods failed!")
             print("   Troubleshooting tips:")
             print("   1. Check your internet connection")
             print("   2. Try using a VPN")
-            print("   3. Install gTTS: pip install gtts pydub")
+            print("   3. Install gTTS: pip install gtts")
             print("   4. Update edge-tts: pip install --upgrade edge-tts")
-            return False
+            return None
         
-        return True
+        return audio_file
 
-    # Run audio generation
-    audio_success = asyncio.run(audio_pipeline())
+    # Run audio generation (the gTTS fallback produces an .mp3 instead of the .wav)
+    audio_file = asyncio.run(audio_pipeline())
     
-    if not audio_success:
+    if not audio_file:
         print("Cannot proceed without audio. Exiting.")
         sys.exit(1)
 
+    # Step 2b: Cut out silence so Whisper only transcribes speech; the trimmed copy is a
+    # temp file, removed once Step 3 is done. faster-whisper already skips silence
+    # (vad_filter), so this is only done for the fallback backends.
+    fd, speech_file = tempfile.mkstemp(suffix='_speech.wav')
+    os.close(fd)
+    speech_spans = None
+    if not faster_whisper_available():
+        try:
+            speech_spans = trim_silence(audio_file, speech_file)
+        except Exception as e:
+            print(f"Silence trimming failed, transcribing full audio: {e}")
+
     # Step 3: Generate Timed Captions
     try:
         print("Generating timed captions...")
-        timed_captions = generate_timed_captions(SAMPLE_FILE_NAME)
+        caption_source = speech_file if speech_spans else audio_file
+        timed_captions = get_or_compute(caption_source, lambda path: generate_timed_captions(path, device=get_default_device()))
+        if speech_spans:
+            timed_captions = restore_caption_times(timed_captions, speech_spans)
         print("Timed captions generated successfully!")
         print(timed_captions)
     except Exception as e:
         print(f"Timed captions generation failed: {e}")
         sys.exit(1)
+    finally:
+        os.remove(speech_file)
 
     # Step 4: Generate Search Terms
     try:
         print("Generating video search queries...")
         search_terms = getVideoSearchQueriesTimed(response, timed_captions)
+        if isinstance(search_terms, FallbackSearchTerms):
+            print("Search query generation failed, using generic fallback search terms")
         print("Search terms generated!")
         print(search_terms)
     except Exception as e:
@@ -168,7 +177,7 @@ if __name__ == "__main__":
     if search_terms is not None:
         try:
             print("Generating background video URLs...")
-            background_video_urls = generate_video_url(search_terms, VIDEO_SERVER)
+            background_video_urls = asyncio.run(generate_video_url_async(search_terms, VIDEO_SERVER))
             print("Background videos found!")
             print(background_video_urls)
         except Exception as e:
@@ -189,7 +198,7 @@ if __name__ == "__main__":
     if background_video_urls is not None:
         try:
             print("Rendering final video...")
-            video = get_output_media(SAMPLE_FILE_NAME, timed_captions, background_video_urls, VIDEO_SERVER)
+            video = get_output_media(audio_file, timed_captions, background_video_urls, VIDEO_SERVER)
             print("Video rendering completed!")
             print(f"Final video: {video}")
         except Exception as e:
@@ -1,7 +1,11 @@
 import streamlit as st
 import os
+import re
 import sys
+import tempfile
 import time
+import itertools
+import logging
 from datetime import datetime
 from pathlib import Path
 
@@ -9,38 +13,58 @@ from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
 
-# Asyncio fix for Streamlit
 import asyncio
-import nest_asyncio
-nest_asyncio.apply()
+import aiohttp
+
+# Caption debug output is off unless LOG_LEVEL=DEBUG
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import utilities
 try:
-    from utility.script.script_generator import generate_script
-    from utility.audio.audio_generator import generate_audio
-    from utility.captions.timed_captions_generator import generate_timed_captions
-    from utility.video.background_video_generator import generate_video_url
+    from utility.script.script_generator import generate_script_async
+    from utility.audio.audio_generator import stream_audio_to_file
+    from utility.cache import cache_get, cache_set
+    from utility.captions.timed_captions_generator import generate_timed_captions, get_default_device, get_faster_whisper_model, faster_whisper_available
+    from utility.captions.cache import get_or_compute
+    from utility.audio.vad import trim_silence, restore_caption_times
+    from utility.video.background_video_generator import generate_video_url_async
     from utility.render.render_engine import get_output_media
-    from utility.video.video_search_query_generator import getVideoSearchQueriesTimed, merge_empty_intervals
+    from utility.video.video_search_query_generator import getVideoSearchQueriesTimedAsync, merge_empty_intervals, FallbackSearchTerms
     import edge_tts
     import whisper_timestamped as whisper
     from gtts import gTTS
-    from pydub import AudioSegment
 except ImportError as e:
     st.error(f"Import error: {e}")
     st.stop()
 
+@st.cache_resource
+def get_whisper_model(size="base"):
+    """Load the Whisper model once per server process"""
+    return whisper.load_model(size, device=get_default_device())
+
+@st.cache_data(max_entries=1)
+def load_video_bytes(video_path, mtime):
+    """Rendered video bytes for the download button, read once per file version (mtime)"""
+    with open(video_path, 'rb') as f:
+        return f.read()
+
 # Check OPENAI_API_KEY
 if not os.getenv('OPENAI_API_KEY'):
     st.error("⚠️ OPENAI_API_KEY not found in environment variables!")
     st.stop()
 
+# Words used as search terms when query generation fails (punctuation stripped)
+FALLBACK_WORD_RE = re.compile(r"\b[a-zA-Z]{4,}\b")
+
 # Page config
 st.set_page_config(page_title="AI Text-to-Video Generator", page_icon="🎬", layout="wide")
 
+# Compile Numba kernels in the background before the first click
+import utility.warmup
+
 # CSS
 st.markdown("""
 <style>
@@ -73,6 +97,9 @@ if 'files' not in st.session_state:
     st.session_state.files = {}
 if 'logs' not in st.session_state:
     st.session_state.logs = []
+# One event loop per session, reused across runs so its connections stay open
+if 'loop' not in st.session_state:
+    st.session_state.loop = asyncio.new_event_loop()
 
 # Sidebar
 with st.sidebar:
@@ -91,30 +118,49 @@ generate_button = st.button("🚀 Generate Video", disabled=(not topic or st.ses
 
 # Utilities
 async def generate_audio_async(text, filename):
-    """Robust audio generation: Edge TTS → gTTS fallback"""
+    """Robust audio generation: Edge TTS → gTTS fallback. Returns the file written or None"""
+    # Reruns with the same script and voice reuse the audio from the disk cache
+    audio_bytes = cache_get("tts", selected_voice, text)
+    if audio_bytes:
+        with open(filename, "wb") as f:
+            f.write(audio_bytes)
+        st.session_state.logs.append("Audio loaded from cache")
+        return filename
     # Edge TTS
     for attempt in range(max_retries):
         try:
             communicate = edge_tts.Communicate(text, selected_voice)
-            await communicate.save(filename)
+            await stream_audio_to_file(communicate, filename)
+            with open(filename, "rb") as f:
+                cache_set("tts", f.read(), selected_voice, text)
             st.session_state.logs.append("Audio generated via Edge TTS")
-            return True
+            return filename
         except Exception as e:
             st.session_state.logs.append(f"Edge TTS failed attempt {attempt+1}: {e}")
             await asyncio.sleep(3*(attempt+1))
     # gTTS fallback
     try:
         tts = gTTS(text=text, lang='en', slow=False)
-        temp_mp3 = filename.replace('.wav','_temp.mp3')
-        tts.save(temp_mp3)
-        audio = AudioSegment.from_mp3(temp_mp3)
-        audio.export(filename, format="wav")
-        os.remove(temp_mp3)
+        # gTTS gives mp3; Whisper reads it directly so no wav conversion
+        mp3_file = os.path.splitext(filename)[0] + '.mp3'
+        tts.save(mp3_file)
         st.session_state.logs.append("Audio generated via gTTS fallback")
-        return True
+        return mp3_file
     except Exception as e:
         st.session_state.logs.append(f"gTTS failed: {e}")
-        return False
+        return None
+
+async def load_whisper_async():
+    """Warm the faster-whisper model in a worker thread while TTS is running; never raises"""
+    # Taken here: st.session_state is not available from the worker thread
+    logs = st.session_state.logs
+    def load():
+        try:
+            get_faster_whisper_model("base", get_default_device())
+        except Exception as e:
+            # Captions load whichever backend works when they run
+            logs.append(f"faster-whisper warmup skipped: {e}")
+    await asyncio.to_thread(load)
 
 def update_step(name, status, message):
     """Display step status"""
@@ -126,40 +172,71 @@ def update_step(name, status, message):
     </div>
     """, unsafe_allow_html=True)
 
+def get_http_session():
+    """aiohttp session bound to the session's event loop (must be called inside it)"""
+    session = st.session_state.get('http_session')
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=16))
+        st.session_state.http_session = session
+    return session
+
 async def run_pipeline(topic_input):
     """Main pipeline"""
+    # Load the caption model while the script and audio are being generated;
+    # the async LLM client leaves the event loop free to start this right away
+    whisper_task = asyncio.create_task(load_whisper_async())
     try:
         update_step('Script', 'processing','Generating script...')
-        script = generate_script(topic_input)
+        script = await generate_script_async(topic_input)
         st.session_state.files['script'] = script
         update_step('Script','success','Script generated')
         
         update_step('Audio','processing','Generating audio...')
-        audio_file = f"audio_{int(time.time())}.wav"
-        success = await generate_audio_async(script, audio_file)
-        if not success: 
+        audio_file = await generate_audio_async(script, f"audio_{int(time.time())}.wav")
+        if not audio_file: 
             update_step('Audio','error','Audio generation failed, check logs')
             return False
         st.session_state.files['audio'] = audio_file
         update_step('Audio','success','Audio generated')
         
         update_step('Captions','processing','Generating timed captions...')
-        captions = generate_timed_captions(audio_file)
+        # Cut out silence so Whisper only transcribes speech; the trimmed copy is a
+        # temp file, removed once the captions are computed. faster-whisper already
+        # skips silence (vad_filter), so this is only done for the fallback backends.
+        fd, speech_file = tempfile.mkstemp(suffix='_speech.wav')
+        os.close(fd)
+        speech_spans = None
+        if not faster_whisper_available():
+            try:
+                speech_spans = trim_silence(audio_file, speech_file)
+            except Exception as e:
+                st.session_state.logs.append(f"Silence trimming failed: {e}")
+        try:
+            await whisper_task
+            caption_source = speech_file if speech_spans else audio_file
+            captions = get_or_compute(caption_source, lambda path: generate_timed_captions(path, device=get_default_device(), load_whisper_model=get_whisper_model))
+        finally:
+            os.remove(speech_file)
+        if speech_spans:
+            captions = restore_caption_times(captions, speech_spans)
         st.session_state.files['captions'] = captions
         update_step('Captions','success','Captions generated')
         
         update_step('Search','processing','Generating search queries...')
         try:
-            search_terms = getVideoSearchQueriesTimed(script, captions)
+            search_terms = await getVideoSearchQueriesTimedAsync(script, captions)
+            if isinstance(search_terms, FallbackSearchTerms):
+                st.session_state.logs.append("Search query generation failed, using generic fallback search terms")
         except Exception:
-            # fallback search terms
-            search_terms = [word for word in script.split() if len(word)>3][:25]
+            # fallback search terms: first 25 distinct words, so Pexels never gets the same query twice
+            words = (match.group(0) for match in FALLBACK_WORD_RE.finditer(script))
+            search_terms = list(itertools.islice(dict.fromkeys(words), 25))
         st.session_state.files['search_terms'] = search_terms
         update_step('Search','success','Search queries ready')
         
         update_step('Video','processing','Finding background videos...')
         try:
-            background_videos = generate_video_url(search_terms,'pexel')
+            background_videos = await generate_video_url_async(search_terms,'pexel', session=get_http_session())
             background_videos = merge_empty_intervals(background_videos)
         except Exception:
             background_videos = None
@@ -177,11 +254,14 @@ async def run_pipeline(topic_input):
     except Exception as e:
         st.error(f"Pipeline error: {e}")
         return False
+    finally:
+        # No-op once awaited; drops the warm-up when the pipeline stops before captions
+        whisper_task.cancel()
 
 # Trigger generation
 if generate_button and topic:
     st.session_state.status='generating'
-    asyncio.run(run_pipeline(topic))
+    st.session_state.loop.run_until_complete(run_pipeline(topic))
     st.session_state.status='completed'
     st.rerun()
 
@@ -196,9 +276,11 @@ if st.session_state.status=='completed':
     
     st.subheader("🎬 Final Video")
     if 'final_video' in st.session_state.files and os.path.exists(st.session_state.files['final_video']):
-        st.video(st.session_state.files['final_video'])
-        with open(st.session_state.files['final_video'],'rb') as f:
-            st.download_button("📥 Download Video", f.read(), file_name=f"video_{int(time.time())}.mp4", mime="video/mp4")
+        video_path = st.session_state.files['final_video']
+        st.video(video_path)
+        # download_button reads whatever it is given on every rerun, so hand it cached bytes
+        video_bytes = load_video_bytes(video_path, os.path.getmtime(video_path))
+        st.download_button("📥 Download Video", data=video_bytes, file_name=Path(video_path).name, mime="video/mp4")
     
     if st.button("🔄 Generate Another"):
         st.session_state.status='ready'
@@ -1,30 +1,92 @@
 import edge_tts
 import asyncio
 import aiohttp
+import os
+import re
+from io import BytesIO
+from utility.cache import cache_get, cache_set
+
+# Scripts longer than this are synthesized sentence-by-sentence in parallel
+PARALLEL_TTS_MIN_CHARS = 400
+
+# No shared aiohttp connector here: edge_tts (6.1.x) opens its own ClientSession and
+# websocket inside Communicate.stream() and takes no session/connector argument, and an
+# upgraded websocket is never handed back to a keep-alive pool anyway. Handshake cost is
+# hidden by generate_audio_parallel running several connections at once instead.
+
+async def stream_audio_to_file(communicate, outputFilename):
+    """Write audio chunks to disk as soon as Edge TTS sends them"""
+    with open(outputFilename, "wb") as f:
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                f.write(chunk["data"])
 
 # Your original function with timeout protection
 async def generate_audio(text, outputFilename):
     """
     Generate audio using Edge TTS with timeout protection
     Keeps your original voice: en-AU-WilliamNeural
+    Returns the path actually written (the gTTS backup may switch it to .mp3)
     """
+    voice = "en-AU-WilliamNeural"
+    audio_bytes = cache_get("tts", voice, text)
+    if audio_bytes:
+        print("✅ Using cached audio")
+        with open(outputFilename, "wb") as f:
+            f.write(audio_bytes)
+        return outputFilename
+    
     try:
-        communicate = edge_tts.Communicate(text, "en-AU-WilliamNeural")
-        # Add timeout to prevent hanging
-        await asyncio.wait_for(communicate.save(outputFilename), timeout=60)
+        if len(text) > PARALLEL_TTS_MIN_CHARS:
+            # Long scripts: one connection per sentence instead of one long stream
+            await asyncio.wait_for(generate_audio_parallel(text, outputFilename), timeout=60)
+        else:
+            communicate = edge_tts.Communicate(text, voice)
+            # Add timeout to prevent hanging
+            await asyncio.wait_for(stream_audio_to_file(communicate, outputFilename), timeout=60)
+        with open(outputFilename, "rb") as f:
+            cache_set("tts", f.read(), voice, text)
+        return outputFilename
         
     except asyncio.TimeoutError:
         print("⚠️ Connection timed out, trying with different settings...")
         # Retry with shorter timeout and different approach
-        await generate_audio_retry(text, outputFilename)
+        return await generate_audio_retry(text, outputFilename)
         
     except aiohttp.ServerTimeoutError:
         print("⚠️ Server timeout, retrying...")
-        await generate_audio_retry(text, outputFilename)
+        return await generate_audio_retry(text, outputFilename)
         
     except Exception as e:
         print(f"⚠️ Error with primary method: {e}")
-        await generate_audio_retry(text, outputFilename)
+        return await generate_audio_retry(text, outputFilename)
+
+# Parallel synthesis for long scripts
+async def generate_audio_parallel(text, outputFilename, concurrency=4, voice="en-AU-WilliamNeural"):
+    """
+    Split the script into sentences and synthesize them concurrently
+    (at most `concurrency` Edge TTS connections at a time), then join
+    the chunks back together in their original order.
+    """
+    sentences = [s for s in re.split(r'(?<=[.!?])\s+', text.strip()) if s.strip()]
+    buffers = [BytesIO() for _ in sentences]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def synthesize(index, sentence):
+        async with semaphore:
+            communicate = edge_tts.Communicate(sentence, voice)
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    buffers[index].write(chunk["data"])
+
+    await asyncio.gather(*(synthesize(i, s) for i, s in enumerate(sentences)))
+
+    # Edge TTS sends plain mp3 frames, so the chunks can be joined byte for byte
+    # (the single-stream path also writes mp3 data whatever the extension)
+    with open(outputFilename, "wb") as f:
+        for buf in buffers:
+            f.write(buf.getvalue())
+    print(f"✅ Synthesized {len(sentences)} sentences in parallel")
 
 # Retry function with multiple attempts
 async def generate_audio_retry(text, outputFilename, max_attempts=3):
@@ -47,10 +109,10 @@ async def generate_audio_retry(text, outputFilename, max_attempts=3):
                 
                 # Try with progressively longer timeouts
                 timeout = 30 + (attempt * 15)  # 30s, 45s, 60s
-                await asyncio.wait_for(communicate.save(outputFilename), timeout=timeout)
+                await asyncio.wait_for(stream_audio_to_file(communicate, outputFilename), timeout=timeout)
                 
                 print(f"✅ Success with {voice}")
-                return
+                return outputFilename
                 
             except (asyncio.TimeoutError, aiohttp.ServerTimeoutError):
                 print(f"⚠️ Timeout with {voice}")
@@ -67,13 +129,16 @@ async def generate_audio_retry(text, outputFilename, max_attempts=3):
     
     # If all Edge TTS attempts fail, try gTTS as final backup
     print("🔄 All Edge TTS attempts failed, trying gTTS backup...")
-    if not generate_audio_gtts_backup(text, outputFilename):
+    backup_file = generate_audio_gtts_backup(text, outputFilename)
+    if not backup_file:
         raise Exception("All audio generation methods failed")
+    return backup_file
 
 # Simple gTTS backup (optional - only used if Edge TTS completely fails)
 def generate_audio_gtts_backup(text, outputFilename):
     """
     Simple gTTS backup - only used if Edge TTS completely fails
+    Returns the mp3 path written, or None
     """
     try:
         from gtts import gTTS
@@ -81,32 +146,17 @@ def generate_audio_gtts_backup(text, outputFilename):
         
         tts = gTTS(text=text, lang='en', slow=False)
         
-        # Handle wav format
-        if outputFilename.endswith('.wav'):
-            # Save as mp3 first
-            mp3_file = outputFilename.replace('.wav', '.mp3')
-            tts.save(mp3_file)
-            
-            # Try to convert to wav
-            try:
-                from pydub import AudioSegment
-                audio = AudioSegment.from_mp3(mp3_file)
-                audio.export(outputFilename, format="wav")
-                import os
-                os.remove(mp3_file)
-            except ImportError:
-                print("⚠️ Keeping as mp3 (install pydub for wav conversion)")
-                import os
-                os.rename(mp3_file, outputFilename.replace('.wav', '.mp3'))
-        else:
-            tts.save(outputFilename)
+        # gTTS only produces mp3 and Whisper decodes mp3 through ffmpeg,
+        # so keep the mp3 instead of converting it to wav
+        mp3_filename = os.path.splitext(outputFilename)[0] + '.mp3'
+        tts.save(mp3_filename)
         
         print("✅ gTTS backup successful")
-        return True
+        return mp3_filename
         
     except ImportError:
         print("❌ gTTS not available (install with: pip install gtts)")
-        return False
+        return None
     except Exception as e:
         print(f"❌ gTTS backup failed: {e}")
-        return False
+        return None
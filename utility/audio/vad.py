@@ -0,0 +1,63 @@
+import logging
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+def detect_speech_spans(audio, min_silence_len=500, silence_thresh=-40, padding_ms=150):
+    """
+    Return the non-silent parts of an AudioSegment as [start_ms, end_ms] spans.
+    Each span is padded a little so word edges are not clipped.
+    """
+    from pydub.silence import detect_nonsilent
+    spans = detect_nonsilent(audio, min_silence_len=min_silence_len, silence_thresh=silence_thresh, seek_step=10)
+
+    merged = []
+    for start, end in spans:
+        start = max(0, start - padding_ms)
+        end = min(len(audio), end + padding_ms)
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def trim_silence(audio_filename, output_filename, min_saving=0.1, **kwargs):
+    """
+    Write a copy of the audio with the silent gaps cut out, for transcription.
+    Returns the kept spans (ms) or None when there is too little silence to bother.
+    """
+    # pydub is only needed here, so it stays off the app's import path
+    from pydub import AudioSegment
+    # No explicit format: Edge TTS writes mp3 data even into .wav files
+    audio = AudioSegment.from_file(audio_filename)
+    spans = detect_speech_spans(audio, **kwargs)
+    if not spans:
+        return None
+
+    kept_ms = sum(end - start for start, end in spans)
+    if kept_ms > len(audio) * (1 - min_saving):
+        log.info("Silence trimming skipped (only %d ms of silence)", len(audio) - kept_ms)
+        return None
+
+    speech = sum((audio[start:end] for start, end in spans), AudioSegment.empty())
+    speech.export(output_filename, format="wav")
+    log.info("Trimmed %d ms of silence (%d speech spans)", len(audio) - kept_ms, len(spans))
+    return spans
+
+def restore_caption_times(timed_captions, spans):
+    """Map caption times on the trimmed track back to the original audio's timeline"""
+    span_array = np.asarray(spans, dtype=np.float64)
+    lengths = (span_array[:, 1] - span_array[:, 0]) / 1000
+    # Where each span starts on the trimmed timeline, in seconds
+    trimmed_starts = np.concatenate(([0.0], np.cumsum(lengths[:-1])))
+    original_starts = span_array[:, 0] / 1000
+
+    def to_original(t, side):
+        k = np.maximum(np.searchsorted(trimmed_starts, t, side=side) - 1, 0)
+        return original_starts[k] + (t - trimmed_starts[k])
+
+    # A time exactly on a span boundary is the end of one span and the start of the next:
+    # starts belong to the later span, ends to the earlier one (not across the cut silence)
+    starts = to_original(np.array([start for (start, _), _ in timed_captions], dtype=np.float64), 'right')
+    ends = to_original(np.array([end for (_, end), _ in timed_captions], dtype=np.float64), 'left')
+    return [((start, end), text) for start, end, (_, text) in zip(starts.tolist(), ends.tolist(), timed_captions)]
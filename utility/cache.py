@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import hashlib
+import inspect
+import logging
+import functools
+
+log = logging.getLogger(__name__)
+
+# Everything is cached under ~/.cache/avcg: JSON results as <namespace>/<hash>.json,
+# remote API results (scripts, TTS audio) in a diskcache under requests/
+CACHE_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "avcg")
+
+# Cached results (JSON files and remote API results alike) are kept on disk for a day
+DEFAULT_EXPIRE = 24 * 60 * 60
+
+try:
+    from diskcache import Cache
+    _cache = Cache(os.path.join(CACHE_ROOT, "requests"))
+except ImportError:
+    log.warning("⚠️ diskcache not installed, API responses will not be cached (pip install diskcache)")
+    _cache = None
+
+def file_hash(path):
+    """SHA256 of a file's contents, read in 1 MB blocks"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def _cache_file(namespace, key):
+    directory = os.path.join(CACHE_ROOT, namespace)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{key}.json")
+
+def _load(path, expire=DEFAULT_EXPIRE):
+    """Cached value at path, or None when missing, older than expire seconds or unreadable"""
+    if os.path.exists(path):
+        if time.time() - os.path.getmtime(path) > expire:
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring unreadable cache entry %s: %s", path, e)
+    return None
+
+def _store(path, result):
+    # Empty results are not stored so a failed run is retried next time
+    if result:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+
+def cached_json(namespace, key, compute, expire=DEFAULT_EXPIRE):
+    """Return the cached result for key (if under expire seconds old), or call compute() and store it."""
+    path = _cache_file(namespace, key)
+    cached = _load(path, expire)
+    if cached is not None:
+        log.debug("Cache hit: %s/%.12s", namespace, key)
+        return cached
+
+    result = compute()
+    _store(path, result)
+    return result
+
+def make_key(prefix, *parts):
+    return prefix + ":" + hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+def cache_get(prefix, *parts):
+    """Cached value for (prefix, parts), or None"""
+    if _cache is None:
+        return None
+    return _cache.get(make_key(prefix, *parts))
+
+def cache_set(prefix, value, *parts, expire=DEFAULT_EXPIRE):
+    if _cache is not None:
+        _cache.set(make_key(prefix, *parts), value, expire=expire)
+
+def cached(prefix, expire=DEFAULT_EXPIRE):
+    """
+    Cache a function's return value on disk, keyed by its arguments.
+    Works for plain and async functions; exceptions (and None results) are not cached.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                result = cache_get(prefix, args, kwargs)
+                if result is not None:
+                    log.debug("Cache hit: %s", prefix)
+                    return result
+                result = await fn(*args, **kwargs)
+                if result is not None:
+                    cache_set(prefix, result, args, kwargs, expire=expire)
+                return result
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            result = cache_get(prefix, args, kwargs)
+            if result is not None:
+                log.debug("Cache hit: %s", prefix)
+                return result
+            result = fn(*args, **kwargs)
+            if result is not None:
+                cache_set(prefix, result, args, kwargs, expire=expire)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,7 @@
+from utility.cache import file_hash, cached_json
+
+def get_or_compute(audio_path, fn):
+    """Timed captions for audio_path, running fn(audio_path) only on a cache miss"""
+    captions = cached_json("captions", file_hash(audio_path), lambda: fn(audio_path))
+    # JSON turns the ((start, end), text) tuples into lists
+    return [((start, end), text) for (start, end), text in captions]
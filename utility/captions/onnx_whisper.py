@@ -0,0 +1,96 @@
+import os
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# Whisper exported to ONNX once (same as `optimum-cli export onnx --model openai/whisper-base`)
+# and run on ONNX Runtime's CUDA provider with IO binding.
+# Needs: pip install optimum[onnxruntime-gpu] transformers
+ONNX_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "avcg", "onnx")
+
+def chunks_to_whisper_result(output):
+    """
+    Convert a transformers ASR pipeline output ({'text', 'chunks': [{'text', 'timestamp'}]})
+    to the whisper result format used by getCaptionsWithTime.
+    Word times inside a chunk are spread in proportion to word length.
+    """
+    segments = []
+    last_end = 0.0
+    for chunk in output.get('chunks', []):
+        start, end = chunk.get('timestamp', (None, None))
+        start = last_end if start is None else float(start)
+        words = chunk.get('text', '').split()
+        if end is None:
+            # The final chunk can come back open-ended
+            end = start + 0.3 * max(len(words), 1)
+        end = max(float(end), start)
+
+        total_chars = sum(len(word) for word in words) or 1
+        word_entries = []
+        position = start
+        for word in words:
+            word_end = position + (end - start) * len(word) / total_chars
+            word_entries.append({'text': word, 'start': position, 'end': word_end})
+            position = word_end
+
+        segments.append({'start': start, 'end': end, 'text': chunk.get('text', ''), 'words': word_entries})
+        last_end = end
+
+    return {'text': output.get('text', ''), 'segments': segments}
+
+class WhisperOnnxRunner:
+    """Process-wide ONNX Runtime Whisper sessions, one per model size, created on first use"""
+    _instances = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def is_available():
+        """True when onnxruntime can run on CUDA (the CPU provider gains nothing here)"""
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            return False
+        return "CUDAExecutionProvider" in ort.get_available_providers()
+
+    @classmethod
+    def get(cls, model_size="base"):
+        with cls._lock:
+            if model_size not in cls._instances:
+                cls._instances[model_size] = cls(model_size)
+            return cls._instances[model_size]
+
+    def __init__(self, model_size="base"):
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+        from transformers import AutoProcessor, pipeline
+
+        model_id = f"openai/whisper-{model_size}"
+        export_dir = os.path.join(ONNX_CACHE_DIR, f"whisper-{model_size}")
+        exported = os.path.exists(os.path.join(export_dir, "config.json"))
+        source = export_dir if exported else model_id
+        log.debug("Loading ONNX Whisper from %s...", source)
+
+        # use_io_binding keeps encoder/decoder inputs and outputs bound to CUDA buffers
+        # instead of copying them through host memory on every call
+        model = ORTModelForSpeechSeq2Seq.from_pretrained(
+            source,
+            export=not exported,
+            provider="CUDAExecutionProvider",
+            use_io_binding=True
+        )
+        processor = AutoProcessor.from_pretrained(source)
+        if not exported:
+            model.save_pretrained(export_dir)
+            processor.save_pretrained(export_dir)
+
+        self.pipe = pipeline(
+            "automatic-speech-recognition",
+            model=model,
+            tokenizer=processor.tokenizer,
+            feature_extractor=processor.feature_extractor,
+            chunk_length_s=30
+        )
+
+    def transcribe(self, audio):
+        output = self.pipe(audio, return_timestamps=True, generate_kwargs={"language": "en"})
+        return chunks_to_whisper_result(output)
@@ -1,30 +1,115 @@
-import whisper_timestamped as whisper
-from whisper_timestamped import load_model, transcribe_timestamped
 import re
 import os
-import traceback
+import logging
+from collections import namedtuple
+import numpy as np
+from utility.captions.onnx_whisper import WhisperOnnxRunner, chunks_to_whisper_result
 
-def generate_timed_captions(audio_filename, model_size="base"):
+log = logging.getLogger(__name__)
+
+class _CleanWordTable(dict):
+    """
+    str.translate table for cleanWord, filled in as characters are seen: keeps letters,
+    digits, underscores, whitespace, hyphens and quotes and drops everything else
+    """
+    def __missing__(self, code):
+        char = chr(code)
+        keep = char.isalnum() or char.isspace() or char in '-_"\''
+        self[code] = code if keep else None
+        return self[code]
+
+_CLEAN_WORD_TABLE = _CleanWordTable()
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?]) +')
+
+# Models are loaded once per (model_size, device) and reused across calls
+_FASTER_WHISPER_MODELS = {}
+_WHISPER_MODELS = {}
+_HF_PIPELINES = {}
+
+# Distilled / turbo checkpoints: faster-whisper loads these by name, and the fallback
+# runs them through Hugging Face transformers (ONNX export and whisper_timestamped
+# only know the openai/whisper-* sizes)
+HF_WHISPER_MODELS = {
+    "distil-small.en": "distil-whisper/distil-small.en",
+    "distil-medium.en": "distil-whisper/distil-medium.en",
+    "distil-large-v2": "distil-whisper/distil-large-v2",
+    "distil-large-v3": "distil-whisper/distil-large-v3",
+    "large-v3-turbo": "openai/whisper-large-v3-turbo",
+}
+
+def get_default_device():
+    """Pick the GPU for Whisper when one is available"""
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def faster_whisper_available():
+    """True when faster-whisper is installed; it skips silence itself (vad_filter)"""
+    import importlib.util
+    return importlib.util.find_spec("faster_whisper") is not None
+
+def generate_timed_captions(audio_filename, model_size="base", device=None, load_whisper_model=None):
     """
     Generate timed captions with multiple fallback methods
+    load_whisper_model() supplies the whisper_timestamped model; it is only called
+    if the faster backends all fail
     """
     try:
-        print(f"Debug: Starting caption generation for {audio_filename}")
-        print(f"Debug: Model size: {model_size}")
+        if device is None:
+            device = get_default_device()
+        log.debug("Starting caption generation for %s", audio_filename)
+        log.debug("Model size: %s, device: %s", model_size, device)
         
         # Check if audio file exists and is valid
         if not os.path.exists(audio_filename):
             raise FileNotFoundError(f"Audio file not found: {audio_filename}")
         
         file_size = os.path.getsize(audio_filename)
-        print(f"Debug: Audio file size: {file_size} bytes")
+        log.debug("Audio file size: %s bytes", file_size)
         
         if file_size == 0:
             raise ValueError("Audio file is empty (0 bytes)")
         
-        print("Debug: Loading Whisper model...")
-        WHISPER_MODEL = load_model(model_size)
-        print("Debug: Model loaded successfully")
+        # Decode once; every backend and fallback below gets the same array
+        audio = decode_audio(audio_filename)
+        
+        # Preferred backend: faster-whisper (CTranslate2, int8 weights);
+        # on the GPU the speech chunks are decoded in batches
+        try:
+            log.debug("Trying faster_whisper...")
+            transcribe = transcribe_batch if device == "cuda" else transcribe_with_faster_whisper
+            result = transcribe(get_faster_whisper_model(model_size, device), audio)
+            if result:
+                log.debug("faster_whisper succeeded!")
+                return getCaptionsWithTime(result)
+        except Exception as e:
+            log.debug("faster_whisper failed: %s", e)
+        
+        # Second choice: transformers for distil-/turbo checkpoints,
+        # ONNX Runtime with IO binding on the GPU for the standard sizes
+        if model_size in HF_WHISPER_MODELS:
+            try:
+                log.debug("Trying transformers pipeline...")
+                result = transcribe_with_hf_pipeline(get_hf_whisper_pipeline(model_size, device), audio)
+                if result:
+                    log.debug("transformers pipeline succeeded!")
+                    return getCaptionsWithTime(result)
+            except Exception as e:
+                log.debug("transformers pipeline failed: %s", e)
+        
+        elif device == "cuda" and WhisperOnnxRunner.is_available():
+            try:
+                log.debug("Trying onnx_whisper...")
+                result = WhisperOnnxRunner.get(model_size).transcribe(audio)
+                if result:
+                    log.debug("onnx_whisper succeeded!")
+                    return getCaptionsWithTime(result)
+            except Exception as e:
+                log.debug("onnx_whisper failed: %s", e)
+        
+        if load_whisper_model is not None:
+            WHISPER_MODEL = load_whisper_model()
+        else:
+            WHISPER_MODEL = get_whisper_model(model_size, device)
         
         # Try multiple transcription methods in order of preference
         methods = [
@@ -36,33 +121,140 @@ def generate_timed_captions(audio_filename, model_size="base"):
         
         for method_name, method_func in methods:
             try:
-                print(f"Debug: Trying {method_name}...")
-                result = method_func(WHISPER_MODEL, audio_filename)
+                log.debug("Trying %s...", method_name)
+                result = method_func(WHISPER_MODEL, audio)
                 if result:
-                    print(f"Debug: {method_name} succeeded!")
+                    log.debug("%s succeeded!", method_name)
                     return getCaptionsWithTime(result)
             except Exception as e:
-                print(f"Debug: {method_name} failed: {str(e)}")
+                log.debug("%s failed: %s", method_name, e)
                 continue
         
         # If all methods fail, return empty captions
-        print("Debug: All transcription methods failed, returning empty captions")
+        log.warning("All transcription methods failed, returning empty captions")
         return []
         
     except Exception as e:
-        print(f"Error in generate_timed_captions: {str(e)}")
-        print(f"Error type: {type(e).__name__}")
-        traceback.print_exc()
+        log.exception("Error in generate_timed_captions: %s", e)
         return []
 
-def transcribe_with_conservative_settings(model, audio_filename):
+def decode_audio(audio_filename):
+    """
+    Decode audio to the 16 kHz mono float32 array all Whisper backends take,
+    or return the path unchanged if decoding fails (each backend then reads the file)
+    """
+    try:
+        import whisper
+        return whisper.load_audio(audio_filename)
+    except Exception as e:
+        log.debug("Could not decode %s up front: %s", audio_filename, e)
+        return audio_filename
+
+def get_faster_whisper_model(model_size="base", device="cpu"):
+    """Load a faster-whisper model once and keep it for later runs"""
+    key = (model_size, device)
+    if key not in _FASTER_WHISPER_MODELS:
+        from faster_whisper import WhisperModel
+        compute_type = "int8_float16" if device == "cuda" else "int8"
+        log.debug("Loading faster-whisper model (%s, %s, %s)...", model_size, device, compute_type)
+        _FASTER_WHISPER_MODELS[key] = WhisperModel(model_size, device=device, compute_type=compute_type)
+    return _FASTER_WHISPER_MODELS[key]
+
+def get_hf_whisper_pipeline(model_size, device="cpu"):
+    """Build a transformers ASR pipeline for a distil-/turbo checkpoint once and keep it"""
+    key = (model_size, device)
+    if key not in _HF_PIPELINES:
+        import torch
+        from transformers import pipeline
+        log.debug("Loading %s with transformers...", HF_WHISPER_MODELS[model_size])
+        _HF_PIPELINES[key] = pipeline(
+            "automatic-speech-recognition",
+            model=HF_WHISPER_MODELS[model_size],
+            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+            device=device,
+            chunk_length_s=30,
+            batch_size=8
+        )
+    return _HF_PIPELINES[key]
+
+def transcribe_with_hf_pipeline(pipe, audio):
+    """Word-level transcription with a transformers pipeline, in the whisper result format"""
+    # English-only (.en) checkpoints reject a language argument
+    generate_kwargs = {} if pipe.model.name_or_path.endswith(".en") else {"language": "en"}
+    output = pipe(audio, return_timestamps="word", generate_kwargs=generate_kwargs)
+    # Each chunk is a single word here, so its timestamps carry over unchanged
+    return chunks_to_whisper_result(output)
+
+def get_whisper_model(model_size="base", device="cpu"):
+    """Load a whisper_timestamped model once and keep it for later runs"""
+    key = (model_size, device)
+    if key not in _WHISPER_MODELS:
+        from whisper_timestamped import load_model
+        if device == "cpu":
+            import torch
+            torch.set_num_threads(os.cpu_count())
+        log.debug("Loading Whisper model...")
+        _WHISPER_MODELS[key] = load_model(model_size, device=device)
+        log.debug("Model loaded successfully")
+    return _WHISPER_MODELS[key]
+
+def transcribe_with_faster_whisper(model, audio):
+    """Transcribe with faster-whisper and convert to the whisper result format"""
+    # Greedy English decoding, same as the conservative whisper_timestamped settings
+    segments, _ = model.transcribe(
+        audio,
+        language="en",
+        beam_size=1,
+        word_timestamps=True,
+        vad_filter=True
+    )
+    return faster_whisper_result(segments)
+
+def transcribe_batch(model, audio, batch_size=16):
+    """
+    Transcribe with faster-whisper's BatchedInferencePipeline: Silero VAD cuts the audio
+    (a path or a 16 kHz float32 array) into speech chunks of up to 30 s, and the chunks
+    are decoded batch_size at a time in one forward pass instead of one after another
+    """
+    from faster_whisper import BatchedInferencePipeline
+    pipeline = BatchedInferencePipeline(model=model)
+    segments, _ = pipeline.transcribe(
+        audio,
+        language="en",
+        beam_size=1,
+        word_timestamps=True,
+        batch_size=batch_size
+    )
+    return faster_whisper_result(segments)
+
+def faster_whisper_result(segments):
+    """Convert faster-whisper segments to the whisper result format"""
+    result_segments = []
+    for segment in segments:
+        result_segments.append({
+            'start': segment.start,
+            'end': segment.end,
+            'text': segment.text,
+            'words': [
+                {'text': word.word, 'start': word.start, 'end': word.end}
+                for word in (segment.words or [])
+            ]
+        })
+    
+    return {
+        'text': ''.join(segment['text'] for segment in result_segments),
+        'segments': result_segments
+    }
+
+def transcribe_with_conservative_settings(model, audio):
     """Most conservative settings to avoid attention weight issues"""
     try:
+        from whisper_timestamped import transcribe_timestamped
         return transcribe_timestamped(
             model, 
-            audio_filename, 
+            audio, 
             verbose=False, 
-            fp16=False,
+            fp16=model_on_cuda(model),
             language="en",
             beam_size=1,
             best_of=1,
@@ -74,35 +266,53 @@ def transcribe_with_conservative_settings(model, audio_filename):
             # Removed word_timestamps parameter as it's causing issues
         )
     except Exception as e:
-        print(f"Conservative settings failed: {e}")
+        log.warning("Conservative settings failed: %s", e)
         raise e
 
-def transcribe_with_basic_settings(model, audio_filename):
+def transcribe_with_basic_settings(model, audio):
     """Basic settings without advanced features"""
     try:
+        from whisper_timestamped import transcribe_timestamped
         return transcribe_timestamped(
             model, 
-            audio_filename, 
+            audio, 
             verbose=False, 
-            fp16=False,
+            fp16=model_on_cuda(model),
             language="en"
             # Removed word_timestamps parameter
         )
     except Exception as e:
-        print(f"Basic settings failed: {e}")
+        log.warning("Basic settings failed: %s", e)
         raise e
 
-def transcribe_with_regular_whisper(model, audio_filename):
+def model_on_cuda(model):
+    """True when the model's weights live on a GPU (fp16 only pays off there)"""
+    import torch
+    
+    device = getattr(model, 'device', None)
+    return device is not None and torch.device(device).type == 'cuda'
+
+def load_audio_on_device(model, audio):
+    """
+    Move the decoded audio to the model's device so Whisper's
+    log-mel spectrogram (STFT, mel filterbank, window) runs there too
+    """
+    import torch
+    import whisper
+    
+    device = getattr(model, 'device', None)
+    if device is None or torch.device(device).type == 'cpu':
+        return audio
+    if isinstance(audio, str):
+        audio = whisper.load_audio(audio)
+    return torch.from_numpy(audio).to(device)
+
+def transcribe_with_regular_whisper(model, audio):
     """Fallback to regular whisper without timestamped version"""
     try:
-        import whisper
-        
-        # Load regular whisper model if we don't have it
-        if not hasattr(model, 'transcribe'):
-            model = whisper.load_model("base")
-        
+        # model is the already loaded Whisper model (it has .transcribe)
         result = model.transcribe(
-            audio_filename,
+            load_audio_on_device(model, audio),
             language="en",
             word_timestamps=True
         )
@@ -122,19 +332,14 @@ def transcribe_with_regular_whisper(model, audio_filename):
                 }]
             }
     except Exception as e:
-        print(f"Regular whisper fallback failed: {e}")
+        log.warning("Regular whisper fallback failed: %s", e)
         return None
 
-def create_simple_timed_captions(model, audio_filename):
+def create_simple_timed_captions(model, audio):
     """Create simple captions without word-level timing"""
     try:
-        import whisper
-        
         # Use basic whisper transcription
-        if not hasattr(model, 'transcribe'):
-            model = whisper.load_model("base")
-            
-        result = model.transcribe(audio_filename, language="en")
+        result = model.transcribe(load_audio_on_device(model, audio), language="en")
         text = result.get('text', '')
         
         if not text:
@@ -153,43 +358,58 @@ def create_simple_timed_captions(model, audio_filename):
             }]
         }
     except Exception as e:
-        print(f"Simple caption creation failed: {e}")
+        log.warning("Simple caption creation failed: %s", e)
         return None
 
 def splitWordsBySize(words, maxCaptionSize):
     halfCaptionSize = maxCaptionSize / 2
     captions = []
-    while words:
-        caption = words[0]
-        words = words[1:]
-        while words and len(caption + ' ' + words[0]) <= maxCaptionSize:
-            caption += ' ' + words[0]
-            words = words[1:]
-            if len(caption) >= halfCaptionSize and words:
+    # Walk the list with an index instead of re-slicing it for every word
+    i = 0
+    n = len(words)
+    while i < n:
+        # Collect the words and track the joined length, then join once
+        parts = [words[i]]
+        caption_len = len(words[i])
+        i += 1
+        while i < n and caption_len + 1 + len(words[i]) <= maxCaptionSize:
+            parts.append(words[i])
+            caption_len += 1 + len(words[i])
+            i += 1
+            if caption_len >= halfCaptionSize and i < n:
                 break
-        captions.append(caption)
+        captions.append(' '.join(parts))
     return captions
 
+# Word k of the transcript ends at character char_end[k] and was spoken from t_start[k] to t_end[k].
+# Words are laid out back to back with one space between them, starting at 0.
+TimestampMap = namedtuple("TimestampMap", ["char_end", "t_start", "t_end"])
+
+def emptyTimestampMapping():
+    return TimestampMap(np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64))
+
 def getTimestampMapping(whisper_analysis):
     try:
-        print("Debug: Creating timestamp mapping...")
+        log.debug("Creating timestamp mapping...")
         index = 0
-        locationToTimestamp = {}
+        char_end = []
+        t_start = []
+        t_end = []
         
         if 'segments' not in whisper_analysis:
-            print("Debug: No segments found in whisper analysis")
-            return {}
+            log.debug("No segments found in whisper analysis")
+            return emptyTimestampMapping()
         
         segments = whisper_analysis['segments']
-        print(f"Debug: Processing {len(segments)} segments")
+        log.debug("Processing %s segments", len(segments))
         
         for seg_idx, segment in enumerate(segments):
             if 'words' not in segment or not segment['words']:
-                print(f"Debug: No words in segment {seg_idx}")
+                log.debug("No words in segment %s", seg_idx)
                 continue
                 
             words = segment['words']
-            print(f"Debug: Segment {seg_idx} has {len(words)} words")
+            log.debug("Segment %s has %s words", seg_idx, len(words))
             
             for word_idx, word in enumerate(words):
                 if not isinstance(word, dict):
@@ -203,54 +423,46 @@ def getTimestampMapping(whisper_analysis):
                     word_text = str(word['word']).strip()
                 
                 if not word_text or 'start' not in word or 'end' not in word:
-                    print(f"Debug: Skipping incomplete word data at segment {seg_idx}, word {word_idx}")
+                    log.debug("Skipping incomplete word data at segment %s, word %s", seg_idx, word_idx)
                     continue
                     
                 if word_text:
-                    start_index = index
                     end_index = index + len(word_text)
-                    locationToTimestamp[(start_index, end_index)] = {
-                        'start': float(word['start']),
-                        'end': float(word['end'])
-                    }
+                    start_time = float(word['start'])
+                    end_time = float(word['end'])
+                    char_end.append(end_index)
+                    t_start.append(start_time)
+                    t_end.append(end_time)
                     index = end_index + 1
         
-        print(f"Debug: Created {len(locationToTimestamp)} timestamp mappings")
-        return locationToTimestamp
+        log.debug("Created %s timestamp mappings", len(char_end))
+        return TimestampMap(
+            np.asarray(char_end, dtype=np.int32),
+            np.asarray(t_start, dtype=np.float64),
+            np.asarray(t_end, dtype=np.float64)
+        )
         
     except Exception as e:
-        print(f"Error in getTimestampMapping: {str(e)}")
-        traceback.print_exc()
-        return {}
+        log.exception("Error in getTimestampMapping: %s", e)
+        return emptyTimestampMapping()
 
 def cleanWord(word):
-    return re.sub(r'[^\w\s\-_"\'\']', '', word)
+    return word.translate(_CLEAN_WORD_TABLE)
 
-def interpolateTimeFromDict(word_position, d, search_type='end'):
-    if not d:
+def interpolateTimeFromDict(word_position, tm, search_type='end'):
+    if len(tm.char_end) == 0 or word_position < 0:
         return None
-        
-    # First try exact matches
-    for (start, end), timestamps in d.items():
-        if start <= word_position < end:
-            return timestamps.get(search_type)
-    
-    # If no exact match, find the closest range
-    closest_time = None
-    min_distance = float('inf')
-    
-    for (start, end), timestamps in d.items():
-        if word_position >= end:
-            distance = word_position - end
-            if distance < min_distance:
-                min_distance = distance
-                closest_time = timestamps.get(search_type)
     
-    return closest_time
+    # Word k starts right after word k-1 ends (+1 space), so the words starting at or
+    # before word_position are those after every word ending before it: the match is
+    # the word containing word_position, or else the closest word ending before it
+    i = min(int(np.searchsorted(tm.char_end, word_position)), len(tm.char_end) - 1)
+    times = tm.t_start if search_type == 'start' else tm.t_end
+    return float(times[i])
 
 def getCaptionsWithTime(whisper_analysis, maxCaptionSize=15, considerPunctuation=False):
     try:
-        print("Debug: Starting getCaptionsWithTime")
+        log.debug("Starting getCaptionsWithTime")
         
         # Validate input
         if not whisper_analysis or not isinstance(whisper_analysis, dict):
@@ -261,11 +473,11 @@ def getCaptionsWithTime(whisper_analysis, maxCaptionSize=15, considerPunctuation
         
         text = whisper_analysis['text']
         if not text or not str(text).strip():
-            print("Debug: Empty or whitespace-only text")
+            log.debug("Empty or whitespace-only text")
             return []
         
         text = str(text).strip()
-        print(f"Debug: Processing text: '{text[:100]}...'")
+        log.debug("Processing text: '%s...'", text[:100])
         
         # Get word-to-timestamp mapping
         wordLocationToTime = getTimestampMapping(whisper_analysis)
@@ -277,17 +489,17 @@ def getCaptionsWithTime(whisper_analysis, maxCaptionSize=15, considerPunctuation
         
         # Split text into caption-sized chunks
         if considerPunctuation:
-            sentences = re.split(r'(?<=[.!?]) +', text)
+            sentences = _SENTENCE_END_RE.split(text)
             words = [word for sentence in sentences for word in splitWordsBySize(sentence.split(), maxCaptionSize)]
         else:
             original_words = text.split()
             words = splitWordsBySize(original_words, maxCaptionSize)
         
-        print(f"Debug: Split into {len(words)} caption chunks")
+        log.debug("Split into %s caption chunks", len(words))
         
         # If we have no timestamp mapping, create simple time-based captions
-        if not wordLocationToTime:
-            print("Debug: No timestamp mapping available, using estimated timing")
+        if len(wordLocationToTime.char_end) == 0:
+            log.debug("No timestamp mapping available, using estimated timing")
             
             # Try to get total duration from segments
             total_duration = 10.0  # Default
@@ -313,7 +525,7 @@ def getCaptionsWithTime(whisper_analysis, maxCaptionSize=15, considerPunctuation
                     if caption_text:
                         CaptionsPairs.append(((start_time, end_time), caption_text))
             
-            print(f"Debug: Created {len(CaptionsPairs)} estimated caption pairs")
+            log.debug("Created %s estimated caption pairs", len(CaptionsPairs))
             return CaptionsPairs
         
         # Process each caption chunk with timestamps
@@ -353,10 +565,9 @@ def getCaptionsWithTime(whisper_analysis, maxCaptionSize=15, considerPunctuation
                 CaptionsPairs.append(((start_time, end_time), caption_text))
                 start_time = end_time
         
-        print(f"Debug: Generated {len(CaptionsPairs)} caption pairs")
+        log.debug("Generated %s caption pairs", len(CaptionsPairs))
         return CaptionsPairs
         
     except Exception as e:
-        print(f"Error in getCaptionsWithTime: {str(e)}")
-        traceback.print_exc()
+        log.exception("Error in getCaptionsWithTime: %s", e)
         return []
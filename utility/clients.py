@@ -0,0 +1,15 @@
+import asyncio
+import weakref
+
+# httpx connections belong to the event loop that opened them,
+# so each loop (asyncio.run call, Streamlit session) gets its own async clients
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_async_client(client_class, api_key):
+    """client_class(api_key=api_key) for the running event loop, created on first use"""
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    key = (client_class, api_key)
+    if key not in clients:
+        clients[key] = client_class(api_key=api_key)
+    return clients[key]
@@ -4,20 +4,30 @@ import tempfile
 import zipfile
 import platform
 import subprocess
+import shutil
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from moviepy.editor import (AudioFileClip, CompositeVideoClip, CompositeAudioClip, ImageClip,
                             TextClip, VideoFileClip)
 from moviepy.audio.fx.audio_loop import audio_loop
 from moviepy.audio.fx.audio_normalize import audio_normalize
-from moviepy.config import change_settings
+from moviepy.config import change_settings, get_setting
 import requests
+from requests.adapters import HTTPAdapter
+
+# Background clips are fetched in parallel over one keep-alive session
+DOWNLOAD_WORKERS = 8
+_http = requests.Session()
+_http.headers["User-Agent"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+_http.mount("https://", HTTPAdapter(pool_maxsize=DOWNLOAD_WORKERS))
 
 def download_file(url, filename):
-    with open(filename, 'wb') as f:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        response = requests.get(url, headers=headers)
-        f.write(response.content)
+    # Stream to disk in 1 MB chunks instead of holding the whole MP4 in memory
+    with _http.get(url, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        with open(filename, 'wb') as f:
+            shutil.copyfileobj(response.raw, f, length=1024 * 1024)
 
 def search_program(program_name):
     try: 
@@ -30,35 +40,215 @@ def get_program_path(program_name):
     program_path = search_program(program_name)
     return program_path
 
+@lru_cache(maxsize=None)
+def ffmpeg_has_encoder(ffmpeg_binary, encoder):
+    if not ffmpeg_binary:
+        return False
+    try:
+        encoders = subprocess.check_output([ffmpeg_binary, "-hide_banner", "-encoders"], stderr=subprocess.DEVNULL, timeout=15)
+    except (subprocess.SubprocessError, OSError):
+        return False
+    return encoder.encode() in encoders
+
+# ImageMagick (for MoviePy's TextClip) is looked up once: PATH first, then the usual install folders
+# Unga PC la endha path la iruko, adha inga podunga!
+MAGICK_CANDIDATES = [
+    r"C:\Program Files\ImageMagick-7.1.2-Q16-HDRI\magick.exe",
+    r"C:\Program Files\ImageMagick-7.1.3-Q16-HDRI\magick.exe",
+    "/usr/local/bin/magick",
+    "/opt/homebrew/bin/magick",
+]
+MAGICK_PATH = shutil.which("magick") or next((path for path in MAGICK_CANDIDATES if os.path.exists(path)), None)
+if MAGICK_PATH:
+    change_settings({"IMAGEMAGICK_BINARY": MAGICK_PATH})
+
+# NVENC needs both an NVIDIA GPU and an ffmpeg build that includes the encoder
+HAVE_NVIDIA_GPU = shutil.which("nvidia-smi") is not None
+HAVE_NVENC = HAVE_NVIDIA_GPU and ffmpeg_has_encoder(shutil.which("ffmpeg"), "h264_nvenc")
+
+def cleanup_files(paths):
+    print("🧹 Cleaning up temp files...")
+    for f in paths:
+        try:
+            os.remove(f)
+        except:
+            pass
+
+def format_srt_time(seconds):
+    millis = int(round(max(seconds, 0) * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+def write_srt(timed_captions, srt_path):
+    with open(srt_path, 'w', encoding='utf-8') as f:
+        index = 1
+        for (t1, t2), text in timed_captions:
+            if not text.strip():
+                continue
+            f.write(f"{index}\n{format_srt_time(t1)} --> {format_srt_time(t2)}\n{text.strip()}\n\n")
+            index += 1
+
+def get_ffmpeg_encoder_args():
+    # Hardware encoder when the GPU and the ffmpeg build support it
+    if HAVE_NVENC:
+        return ["-c:v", "h264_nvenc", "-preset", "p1", "-b:v", "4M"]
+    return ["-c:v", "libx264", "-preset", "veryfast"]
+
+def render_with_ffmpeg(audio_file_path, timed_captions, video_segments, output_file, width=1920, height=1080, fps=24):
+    """
+    Render the whole video in one ffmpeg pass: trim + scale each background clip,
+    concat them (black where there is no clip), burn in the captions and mux the audio.
+    video_segments is a list of ((t1, t2), local_video_path).
+    """
+    ffmpeg = get_program_path("ffmpeg")
+    if not ffmpeg:
+        raise Exception("ffmpeg not found on PATH")
+
+    work_dir = tempfile.mkdtemp()
+    # Relative name + cwd avoids escaping Windows paths inside the filtergraph
+    write_srt(timed_captions, os.path.join(work_dir, "captions.srt"))
+
+    inputs = []
+    filters = []
+    labels = []
+    current = 0.0
+    for (t1, t2), video_path in sorted(video_segments, key=lambda seg: seg[0][0]):
+        if t1 > current + 0.01:
+            label = f"v{len(labels)}"
+            filters.append(f"color=c=black:s={width}x{height}:r={fps}:d={t1 - current:.3f},setsar=1,format=yuv420p[{label}]")
+            labels.append(label)
+            current = t1
+        duration = t2 - current
+        if duration <= 0:
+            continue
+        input_index = len(inputs) // 4
+        inputs += ["-stream_loop", "-1", "-i", os.path.abspath(video_path)]
+        label = f"v{len(labels)}"
+        filters.append(
+            f"[{input_index}:v]trim=duration={duration:.3f},setpts=PTS-STARTPTS,"
+            f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},"
+            f"fps={fps},setsar=1,format=yuv420p[{label}]"
+        )
+        labels.append(label)
+        current = t2
+
+    if not labels:
+        raise Exception("No video segments to render")
+
+    audio_index = len(inputs) // 4
+    inputs += ["-i", os.path.abspath(audio_file_path)]
+
+    caption_style = "FontName=Arial,FontSize=24,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,BorderStyle=1,Outline=2,Shadow=0,Alignment=2"
+    filters.append("".join(f"[{label}]" for label in labels) + f"concat=n={len(labels)}:v=1:a=0[vcat]")
+    # Hold the last frame until the audio ends (-shortest cuts it there)
+    filters.append(f"[vcat]tpad=stop=-1:stop_mode=clone,subtitles=captions.srt:force_style='{caption_style}'[vout]")
+
+    command = [ffmpeg, "-y", "-loglevel", "error"] + inputs + [
+        "-filter_complex", ";".join(filters),
+        "-map", "[vout]", "-map", f"{audio_index}:a",
+    ] + get_ffmpeg_encoder_args() + [
+        "-r", str(fps), "-c:a", "aac", "-movflags", "+faststart", "-shortest",
+        os.path.abspath(output_file)
+    ]
+
+    try:
+        subprocess.run(command, cwd=work_dir, check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        raise Exception(f"ffmpeg render failed: {e.stderr.decode(errors='ignore').strip()}")
+    finally:
+        try:
+            os.remove(os.path.join(work_dir, "captions.srt"))
+            os.rmdir(work_dir)
+        except OSError:
+            pass
+
+    return output_file
+
+def render_caption_clips(caption_texts, width=1536):
+    """
+    Render every caption image in a single ImageMagick process instead of one
+    process per TextClip. caption_texts maps a key to the caption text; returns
+    a dict of key -> ImageClip with the same styling TextClip(method="caption") uses.
+    """
+    if not caption_texts:
+        return {}
+    work_dir = tempfile.mkdtemp()
+    try:
+        command = [
+            get_setting("IMAGEMAGICK_BINARY"),
+            "-background", "transparent", "-fill", "white", "-font", "Arial",
+            "-pointsize", "70", "-stroke", "black", "-strokewidth", "2",
+            "-size", f"{width}x", "-gravity", "center"
+        ]
+        images = {}
+        for i, (key, text) in enumerate(caption_texts.items()):
+            # Text is read from a file (like TextClip does) so quotes, '@' and '%' need no escaping
+            text_path = os.path.join(work_dir, f"caption_{i}.txt")
+            with open(text_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            image_path = os.path.join(work_dir, f"caption_{i}.png")
+            command += ["(", f"caption:@{text_path}", "-type", "truecolormatte",
+                        "-write", f"PNG32:{image_path}", "+delete", ")"]
+            images[key] = image_path
+        # Every caption is written inside its parentheses; the final output is a dummy
+        command += ["xc:none", "null:"]
+
+        subprocess.run(command, check=True, capture_output=True, timeout=120)
+        # ImageClip reads the PNG into memory, so the files can go right away
+        return {key: ImageClip(path, transparent=True) for key, path in images.items()}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
 def get_output_media(audio_file_path, timed_captions, background_video_data, video_server):
     OUTPUT_FILE_NAME = "rendered_video.mp4"
 
-    # ✅ STEP 1: VERIFY IMAGEMAGICK PATH
-    # Unga PC la endha path la iruko, adha inga podunga!
-    # Common paths:
-    # r"C:\Program Files\ImageMagick-7.1.2-Q16-HDRI\magick.exe"
-    # r"C:\Program Files\ImageMagick-7.1.3-Q16-HDRI\magick.exe"
-    magick_path = r"C:\Program Files\ImageMagick-7.1.2-Q16-HDRI\magick.exe" 
-    
-    if os.path.exists(magick_path):
-        print(f"✅ Found ImageMagick at: {magick_path}")
-        change_settings({"IMAGEMAGICK_BINARY": magick_path})
+    # ✅ STEP 1: IMAGEMAGICK PATH (found once at import)
+    if MAGICK_PATH:
+        print(f"✅ Found ImageMagick at: {MAGICK_PATH}")
     else:
-        print(f"❌ ImageMagick NOT found at: {magick_path}")
-        print("Please install ImageMagick and update the path in render_engine.py")
+        print("❌ ImageMagick NOT found on PATH or in MAGICK_CANDIDATES")
+        print("Please install ImageMagick and add its path to MAGICK_CANDIDATES in render_engine.py")
 
     visual_clips = []
     downloaded_files = [] # To keep track for cleanup
 
     print("📥 Downloading background videos...")
     
+    tasks = []
     for (t1, t2), video_url in background_video_data:
+        video_filename = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4').name
+        downloaded_files.append(video_filename)
+        tasks.append(((t1, t2), video_url, video_filename))
+
+    def fetch(task):
+        (t1, t2), video_url, video_filename = task
         try:
-            # Download the video file
-            video_filename = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4').name
             download_file(video_url, video_filename)
-            downloaded_files.append(video_filename)
+            return ((t1, t2), video_filename)
+        except Exception as e:
+            print(f"⚠️ Error downloading video segment {t1}-{t2}: {e}")
+            return None
+
+    # Downloads run concurrently; map() keeps the segments in their original order
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        video_segments = [segment for segment in executor.map(fetch, tasks) if segment]
+
+    if not video_segments:
+        raise Exception("No video clips were loaded! Check internet or Pexels API.")
 
+    # ✅ FAST PATH: one ffmpeg pass (no MoviePy frame compositing)
+    try:
+        print("🎬 Rendering with a single ffmpeg pass...")
+        render_with_ffmpeg(audio_file_path, timed_captions, video_segments, OUTPUT_FILE_NAME)
+        cleanup_files(downloaded_files)
+        return OUTPUT_FILE_NAME
+    except Exception as e:
+        print(f"⚠️ ffmpeg render failed, falling back to MoviePy: {e}")
+
+    for (t1, t2), video_filename in video_segments:
+        try:
             # Create VideoFileClip
             video_clip = VideoFileClip(video_filename)
             video_clip = video_clip.set_start(t1)
@@ -80,22 +270,36 @@ def get_output_media(audio_file_path, timed_captions, background_video_data, vid
     
     # ✅ STEP 2: CAPTIONS LOGIC (UPDATED)
     print("📝 Generating text overlays...")
+    # One ImageMagick render per distinct caption; set_start/set_end return copies
+    # that share the rendered bitmap and mask
+    caption_texts = {}
+    for (t1, t2), text in timed_captions:
+        if text.strip():
+            caption_texts.setdefault(text.strip(), text)
+    rendered = {}
+    try:
+        rendered = render_caption_clips(caption_texts)
+    except Exception as e:
+        print(f"⚠️ Batch caption render failed, rendering captions one by one: {e}")
+
     for (t1, t2), text in timed_captions:
         if not text.strip():
             continue
             
         try:
-            text_clip = TextClip(
-                txt=text, 
-                fontsize=70, 
-                color="white", 
-                stroke_width=2, 
-                stroke_color="black", 
-                font="Arial", 
-                method="caption", 
-                size=(1920*0.8, None) # 80% of screen width
-            )
-            text_clip = text_clip.set_start(t1)
+            key = text.strip()
+            if key not in rendered:
+                rendered[key] = TextClip(
+                    txt=text, 
+                    fontsize=70, 
+                    color="white", 
+                    stroke_width=2, 
+                    stroke_color="black", 
+                    font="Arial", 
+                    method="caption", 
+                    size=(1920*0.8, None) # 80% of screen width
+                )
+            text_clip = rendered[key].set_start(t1)
             text_clip = text_clip.set_end(t2)
             text_clip = text_clip.set_position(("center", "bottom")) # Safe position
             visual_clips.append(text_clip)
@@ -112,14 +316,21 @@ def get_output_media(audio_file_path, timed_captions, background_video_data, vid
     video.duration = audio_file_clip.duration
 
     # Write Output
-    video.write_videofile(OUTPUT_FILE_NAME, codec='libx264', audio_codec='aac', fps=24, preset='veryfast')
+    # MoviePy may use its own ffmpeg binary (imageio-ffmpeg), so check that one for NVENC
+    write_options = dict(
+        audio_codec='aac',
+        fps=24,
+        bitrate='4M',
+        audio_bufsize=2000,
+        threads=os.cpu_count(),
+        ffmpeg_params=['-movflags', '+faststart']
+    )
+    if HAVE_NVIDIA_GPU and ffmpeg_has_encoder(get_setting("FFMPEG_BINARY"), "h264_nvenc"):
+        video.write_videofile(OUTPUT_FILE_NAME, codec='h264_nvenc', preset='p1', **write_options)
+    else:
+        video.write_videofile(OUTPUT_FILE_NAME, codec='libx264', preset='veryfast', **write_options)
 
     # ✅ STEP 4: CLEANUP
-    print("🧹 Cleaning up temp files...")
-    for f in downloaded_files:
-        try:
-            os.remove(f)
-        except:
-            pass
+    cleanup_files(downloaded_files)
 
     return OUTPUT_FILE_NAME
\ No newline at end of file
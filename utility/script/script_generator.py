@@ -1,41 +1,55 @@
 import os
 import json
 import re
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from utility.clients import get_async_client
+from utility.cache import cached
+
+try:
+    import orjson
+    _loads = orjson.loads  # orjson.JSONDecodeError subclasses json.JSONDecodeError
+except ImportError:
+    _loads = json.loads
 
 groq_key = os.environ.get("GROQ_API_KEY")
 if groq_key and len(groq_key) > 30:
-    from groq import Groq
+    from groq import Groq, AsyncGroq as AsyncClient
     model = "llama-3.3-70b-versatile"
     client = Groq(api_key=groq_key)
 else:
     OPENAI_API_KEY = os.getenv("OPENAI_KEY")
     model = "gpt-4o"
     client = OpenAI(api_key=OPENAI_API_KEY)
+    AsyncClient = AsyncOpenAI
+
+# Compiled once; used on every model response
+_MD_JSON_RE = re.compile(r'^```json\s*', re.MULTILINE)
+_MD_END_RE = re.compile(r'\s*```$', re.MULTILINE)
+_SCRIPT_RE = re.compile(r'"script"\s*:\s*"([^"]*)"', re.DOTALL)
 
 def extract_json_from_response(content):
     """Extract JSON from AI response that might have extra text."""
-    # Remove markdown code blocks if present
-    content = re.sub(r'^```json\s*', '', content, flags=re.MULTILINE)
-    content = re.sub(r'\s*```$', '', content, flags=re.MULTILINE)
-    
-    # Try to find JSON object using regex
-    json_pattern = r'\{[^{}]*"script"\s*:\s*"[^"]*"[^{}]*\}'
-    match = re.search(json_pattern, content, re.DOTALL)
-    
-    if match:
-        return match.group(0)
+    # Common case: the model followed the prompt and returned bare JSON
+    try:
+        _loads(content)
+        return content
+    except json.JSONDecodeError:
+        pass
     
-    # If no match, try to find the content between first { and last }
+    # Content between the first { and the last } (also drops ```json fences around it)
     start = content.find('{')
     end = content.rfind('}')
     
     if start != -1 and end != -1 and end > start:
         return content[start:end+1]
     
+    # Remove markdown code blocks if present
+    content = _MD_JSON_RE.sub('', content)
+    content = _MD_END_RE.sub('', content)
     return content
 
-def generate_script(topic):
+def script_request(topic):
+    """Keyword arguments for chat.completions.create, shared by the sync and async paths"""
     prompt = (
         """You are a seasoned content writer for a YouTube Shorts channel, specializing in facts videos.
         
@@ -66,63 +80,135 @@ def generate_script(topic):
         """
     )
 
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": topic}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
+    return dict(
+        model=model,
+        messages=[
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": topic}
+        ],
+        temperature=0.7,
+        max_tokens=500
+    )
+
+class ScriptParseError(ValueError):
+    """No script could be parsed from the reply; .text is the cleaned raw reply to fall back on"""
+    def __init__(self, text):
+        super().__init__("could not parse a script from the model's reply")
+        self.text = text
 
-        content = response.choices[0].message.content.strip()
-        print(f"Raw AI response: {content}")  # Debug output
+def parse_script_response(content):
+    """Pull the script text out of the model's reply (raises ScriptParseError if nothing parses)"""
+    print(f"Raw AI response: {content}")  # Debug output
+    
+    # Try multiple parsing strategies
+    parsing_strategies = [
+        # Strategy 1: Direct parsing
+        lambda x: _loads(x),
         
-        # Try multiple parsing strategies
-        parsing_strategies = [
-            # Strategy 1: Direct parsing
-            lambda x: json.loads(x),
-            
-            # Strategy 2: Extract JSON from mixed content
-            lambda x: json.loads(extract_json_from_response(x)),
-            
-            # Strategy 3: Clean whitespace and special characters
-            lambda x: json.loads(x.strip().replace('\n', ' ').replace('\r', '')),
-            
-            # Strategy 4: Remove potential markdown
-            lambda x: json.loads(x.strip().strip('`').replace('```json', '').replace('```', '')),
-        ]
+        # Strategy 2: Extract JSON from mixed content
+        lambda x: _loads(extract_json_from_response(x)),
         
-        for i, strategy in enumerate(parsing_strategies, 1):
-            try:
-                parsed = strategy(content)
-                if isinstance(parsed, dict) and 'script' in parsed:
-                    print(f"✅ Successfully parsed using strategy {i}")
-                    return parsed['script']
-                elif isinstance(parsed, dict):
-                    print(f"⚠️ Strategy {i} parsed JSON but no 'script' key found")
-                    # Return the first string value if no 'script' key
-                    for value in parsed.values():
-                        if isinstance(value, str):
-                            return value
-            except (json.JSONDecodeError, KeyError, TypeError) as e:
-                print(f"❌ Strategy {i} failed: {str(e)}")
-                continue
+        # Strategy 3: Clean whitespace and special characters
+        lambda x: _loads(x.strip().replace('\n', ' ').replace('\r', '')),
         
-        # If all strategies fail, try to extract content manually
-        if content.startswith('{') and '}' in content:
-            # Find script content between quotes
-            script_match = re.search(r'"script"\s*:\s*"([^"]*)"', content, re.DOTALL)
-            if script_match:
-                print("✅ Extracted script using regex fallback")
-                return script_match.group(1)
+        # Strategy 4: Remove potential markdown
+        lambda x: _loads(x.strip().strip('`').replace('```json', '').replace('```', '')),
+    ]
+    
+    for i, strategy in enumerate(parsing_strategies, 1):
+        try:
+            parsed = strategy(content)
+            if isinstance(parsed, dict) and 'script' in parsed:
+                print(f"✅ Successfully parsed using strategy {i}")
+                return parsed['script']
+            elif isinstance(parsed, dict):
+                print(f"⚠️ Strategy {i} parsed JSON but no 'script' key found")
+                # Return the first string value if no 'script' key
+                for value in parsed.values():
+                    if isinstance(value, str):
+                        return value
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            print(f"❌ Strategy {i} failed: {str(e)}")
+            continue
+    
+    # If all strategies fail, try to extract content manually
+    if content.startswith('{') and '}' in content:
+        # Find script content between quotes
+        script_match = _SCRIPT_RE.search(content)
+        if script_match:
+            print("✅ Extracted script using regex fallback")
+            return script_match.group(1)
+    
+    # Last resort (in generate_script): the cleaned content, raised so it is never cached
+    raise ScriptParseError(content.strip().strip('`').replace('```json', '').replace('```', ''))
+
+def json_closed(parts, delta):
+    """True once a closing brace has arrived and the streamed text is a complete JSON object"""
+    if '}' not in delta:
+        return False
+    try:
+        _loads(''.join(parts))
+        return True
+    except json.JSONDecodeError:
+        return False
+
+# Same topic and model within a day -> same script, without another API call.
+# These raise on API errors and on replies that do not parse (ScriptParseError),
+# so neither error messages nor unparsed replies end up in the cache.
+# The reply is streamed and the stream is dropped as soon as {"script": ...} is complete.
+@cached(f"script:{model}")
+def request_script(topic):
+    stream = client.chat.completions.create(**script_request(topic), stream=True)
+    parts = []
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ''
+            parts.append(delta)
+            if json_closed(parts, delta):
+                break
+    finally:
+        stream.close()
+    content = ''.join(parts).strip()
+    return parse_script_response(content)
+
+@cached(f"script:{model}")
+async def request_script_async(topic):
+    stream = await get_async_client(AsyncClient, client.api_key).chat.completions.create(**script_request(topic), stream=True)
+    parts = []
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ''
+            parts.append(delta)
+            if json_closed(parts, delta):
+                break
+    finally:
+        await stream.close()
+    content = ''.join(parts).strip()
+    return parse_script_response(content)
+
+def generate_script(topic):
+    try:
+        return request_script(topic)
         
-        # Last resort: return cleaned content
+    except ScriptParseError as e:
         print("⚠️ All parsing failed, returning cleaned raw content")
-        return content.strip().strip('`').replace('```json', '').replace('```', '')
+        return e.text
+    except Exception as e:
+        print(f"❌ Error in generate_script: {str(e)}")
+        return f"Error generating script: {str(e)}"
+
+async def generate_script_async(topic):
+    """generate_script on the async client, so the event loop keeps running other tasks"""
+    try:
+        return await request_script_async(topic)
         
+    except ScriptParseError as e:
+        print("⚠️ All parsing failed, returning cleaned raw content")
+        return e.text
     except Exception as e:
         print(f"❌ Error in generate_script: {str(e)}")
         return f"Error generating script: {str(e)}"
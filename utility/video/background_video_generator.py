@@ -1,31 +1,65 @@
 import os 
+import asyncio
+import aiohttp
 import requests
 from utility.utils import log_response,LOG_TYPE_PEXEL
 
 PEXELS_API_KEY = os.environ.get('PEXELS_KEY')
+PEXELS_SEARCH_URL = "https://api.pexels.com/videos/search"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 
-def search_videos(query_string, orientation_landscape=True):
-   
-    url = "https://api.pexels.com/videos/search"
+def _search_params(query_string, orientation_landscape):
     headers = {
         "Authorization": PEXELS_API_KEY,
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+        "User-Agent": USER_AGENT
     }
     params = {
         "query": query_string,
         "orientation": "landscape" if orientation_landscape else "portrait",
         "per_page": 15
     }
+    return headers, params
+
+def search_videos(query_string, orientation_landscape=True):
+   
+    headers, params = _search_params(query_string, orientation_landscape)
 
-    response = requests.get(url, headers=headers, params=params)
+    response = requests.get(PEXELS_SEARCH_URL, headers=headers, params=params)
     json_data = response.json()
     log_response(LOG_TYPE_PEXEL,query_string,response.json())
    
     return json_data
 
+async def search_videos_async(session, query_string, orientation_landscape=True, cache=None):
+    """
+    Pexels search on an aiohttp session. cache is an optional dict of results keyed by
+    (query, orientation); only successful searches are stored in it. A failed search
+    (rate limit, server error) returns an empty result so the caller tries its next term.
+    """
+    key = (query_string, orientation_landscape)
+    if cache is not None and key in cache:
+        return cache[key]
 
-def getBestVideo(query_string, orientation_landscape=True, used_vids=[]):
-    vids = search_videos(query_string, orientation_landscape)
+    headers, params = _search_params(query_string, orientation_landscape)
+
+    async with session.get(PEXELS_SEARCH_URL, headers=headers, params=params) as response:
+        if response.status != 200:
+            # Error bodies (429 / 5xx) are not search results and may not even be JSON
+            print(f"⚠️ Pexels search failed for '{query_string}' (HTTP {response.status})")
+            return {'videos': []}
+        json_data = await response.json(content_type=None)
+    log_response(LOG_TYPE_PEXEL,query_string,json_data)
+
+    if not isinstance(json_data, dict) or 'videos' not in json_data:
+        print(f"⚠️ Pexels search for '{query_string}' returned no 'videos'")
+        return {'videos': []}
+
+    if cache is not None:
+        cache[key] = json_data
+    return json_data
+
+
+def pick_best_video(vids, query_string, orientation_landscape=True, used_vids=[]):
     videos = vids['videos']  # Extract the videos list from JSON
 
     # Filter and extract videos with width and height as 1920x1080 for landscape or 1080x1920 for portrait
@@ -52,6 +86,11 @@ def getBestVideo(query_string, orientation_landscape=True, used_vids=[]):
     return None
 
 
+def getBestVideo(query_string, orientation_landscape=True, used_vids=[]):
+    vids = search_videos(query_string, orientation_landscape)
+    return pick_best_video(vids, query_string, orientation_landscape, used_vids)
+
+
 def generate_video_url(timed_video_searches,video_server):
         timed_video_urls = []
         if video_server == "pexel":
@@ -69,3 +108,49 @@ def generate_video_url(timed_video_searches,video_server):
             timed_video_urls = get_images_for_video(timed_video_searches)
 
         return timed_video_urls
+
+
+async def generate_video_url_async(timed_video_searches, video_server, session=None):
+    """
+    Same result as generate_video_url, but the Pexels searches run concurrently.
+    Every segment's first search term is fetched in one round; segments that found
+    nothing move on to their next term in the following round.
+    Pass a long-lived aiohttp session to reuse its connections across calls.
+    """
+    if video_server != "pexel":
+        return generate_video_url(timed_video_searches, video_server)
+
+    segments = [((t1, t2), list(search_terms)) for (t1, t2), search_terms in timed_video_searches]
+    urls = ["" if not search_terms else None for _, search_terms in segments]
+    used_links = []
+    pending = [i for i, (_, search_terms) in enumerate(segments) if search_terms]
+    depth = 0
+    # Repeated terms are fetched once per call; nothing outlives the call
+    search_cache = {}
+
+    owns_session = session is None
+    if owns_session:
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=16))
+    try:
+        while pending:
+            queries = list(dict.fromkeys(segments[i][1][depth] for i in pending))
+            results = await asyncio.gather(*(search_videos_async(session, query, cache=search_cache) for query in queries))
+            results_by_query = dict(zip(queries, results))
+
+            # Pick in segment order so used_links dedupes clips the same way the serial version does
+            still_pending = []
+            for i in pending:
+                query = segments[i][1][depth]
+                url = pick_best_video(results_by_query[query], query, orientation_landscape=True, used_vids=used_links)
+                if url:
+                    used_links.append(url.split('.hd')[0])
+                    urls[i] = url
+                elif depth + 1 < len(segments[i][1]):
+                    still_pending.append(i)
+            pending = still_pending
+            depth += 1
+    finally:
+        if owns_session:
+            await session.close()
+
+    return [[[t1, t2], url] for ((t1, t2), _), url in zip(segments, urls)]
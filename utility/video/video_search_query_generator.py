@@ -1,23 +1,64 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import os
 import json
 import re
+import asyncio
+import logging
+import sys
+import numpy as np
 from datetime import datetime
+from functools import lru_cache
 from utility.utils import log_response, LOG_TYPE_GPT
+from utility.clients import get_async_client
+from utility.cache import cache_get, cache_set
+
+log = logging.getLogger(__name__)
+
+try:
+    import orjson
+    _loads = orjson.loads  # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    def _dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+except ImportError:
+    _loads = json.loads
+    def _dumps(obj):
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
 
 if len(os.environ.get("GROQ_API_KEY", "")) > 30:
-    from groq import Groq
+    from groq import Groq, AsyncGroq as AsyncClient
     model = "llama-3.3-70b-versatile"
     client = Groq(
         api_key=os.environ.get("GROQ_API_KEY"),
     )
+    PROMPT_CACHE_KEY = None
 else:
     model = "gpt-4o"
     OPENAI_API_KEY = os.environ.get('OPENAI_KEY')
     client = OpenAI(api_key=OPENAI_API_KEY)
+    AsyncClient = AsyncOpenAI
+    # Routes every request to the same prompt cache; the system prompt is the long, stable prefix
+    PROMPT_CACHE_KEY = "video_search_queries_v1"
+
+try:
+    from numba import njit
+except ImportError:
+    # Plain Python fallback when numba is not installed
+    def njit(*args, **kwargs):
+        def decorator(fn):
+            return fn
+        return decorator
 
 log_directory = ".logs/gpt_logs"
 
+# Patterns used while parsing every AI reply, compiled once
+_MD_JSON_FENCE_START = re.compile(r'^```json\s*', re.MULTILINE)
+_MD_FENCE_END = re.compile(r'\s*```$', re.MULTILINE)
+_SINGLE_QUOTE_KEY = re.compile(r"'([^']*)'(?=\s*[,\]\}])")
+_ADJACENT_ARRAYS = re.compile(r'(\])\s*(\[)')
+_TRAILING_COMMA = re.compile(r',\s*(\]|\})')
+_WS = re.compile(r'\s+')
+_KEYWORD_RE = re.compile(r'\b[A-Z][a-z]+\b|\b[a-z]{4,}\b')
+
 prompt = """# Instructions
 
 Given the following video script and timed captions, extract three visually concrete and specific keywords for each time segment that can be used to search for background videos. The keywords should be short and capture the main essence of the sentence. They can be synonyms or related terms. If a caption is vague or general, consider the next timed caption for more context. If a keyword is a single word, try to return a two-word keyword that is visually concrete. If a time frame contains two or more important pieces of information, divide it into shorter time frames with one keyword each. Ensure that the time periods are strictly consecutive and cover the entire length of the video. 
@@ -45,19 +86,77 @@ IMPORTANT: Return ONLY a valid JSON array. Do not include any explanatory text,
 Note: Your response should be the JSON array only and no extra text or data.
 """
 
+# Built once and shared by every request (the SDK only reads the messages it is given)
+SYSTEM_MSG = {"role": "system", "content": prompt}
+
+class _BracketScanner:
+    """
+    Single-pass bracket-depth scan for the first top-level [[...]], fed text piece by
+    piece (so it also works on a streamed reply). Only a [ followed by another [ (whitespace
+    allowed) opens the array, so a bracketed aside in a preamble ("[as requested]") is
+    skipped. Brackets inside "strings" are ignored.
+    """
+    def __init__(self):
+        self.started = False
+        self.start = -1  # Index of the opening [ in all the text fed so far
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self._opened_at = -1  # A [ waiting for its next non-space character
+        self._offset = 0
+
+    def feed(self, text):
+        """Index in text where the array closes, or -1 if it is still open"""
+        for i, char in enumerate(text):
+            if not self.started:
+                if char == '[':
+                    if self._opened_at != -1:
+                        self.started = True
+                        self.start = self._opened_at
+                        self.depth = 2
+                    else:
+                        self._opened_at = self._offset + i
+                elif not char.isspace():
+                    self._opened_at = -1
+            elif self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '[':
+                self.depth += 1
+            elif char == ']':
+                self.depth -= 1
+                if self.depth == 0:
+                    return i
+        self._offset += len(text)
+        return -1
+
+def _extract_array_bracket_scan(content):
+    """Return the first complete top-level [[...]] in content, or None (e.g. a cut-off reply)."""
+    scanner = _BracketScanner()
+    end = scanner.feed(content)
+    if end == -1:
+        return None
+    return content[scanner.start:end + 1]
+
+@lru_cache(maxsize=32)
 def extract_json_array_from_response(content):
     """Extract JSON array from AI response that might have extra text."""
     # Remove markdown code blocks if present
-    content = re.sub(r'^```json\s*', '', content, flags=re.MULTILINE)
-    content = re.sub(r'\s*```$', '', content, flags=re.MULTILINE)
+    content = _MD_JSON_FENCE_START.sub('', content)
+    content = _MD_FENCE_END.sub('', content)
     content = content.strip()
     
-    # Try to find JSON array using regex
-    json_array_pattern = r'\[\s*\[\s*\[\s*[\d\.,\s]+\]\s*,\s*\[.*?\]\s*\].*?\]'
-    match = re.search(json_array_pattern, content, re.DOTALL)
+    # Try to find the first complete JSON array of arrays
+    array = _extract_array_bracket_scan(content)
     
-    if match:
-        return match.group(0)
+    if array:
+        return array
     
     # If no match, try to find content between first [ and last ]
     start = content.find('[')
@@ -68,6 +167,7 @@ def extract_json_array_from_response(content):
     
     return content
 
+@lru_cache(maxsize=32)
 def fix_json_format(json_str):
     """Fix common JSON formatting issues."""
     try:
@@ -77,28 +177,50 @@ def fix_json_format(json_str):
         json_str = json_str.replace("'", '"')
         
         # Fix single quotes to double quotes (but be careful about contractions)
-        json_str = re.sub(r"'([^']*)'(?=\s*[,\]\}])", r'"\1"', json_str)
+        if "'" in json_str:
+            json_str = _SINGLE_QUOTE_KEY.sub(r'"\1"', json_str)
         
         # Fix missing commas between array elements
-        json_str = re.sub(r'(\])\s*(\[)', r'\1,\2', json_str)
+        json_str = _ADJACENT_ARRAYS.sub(r'\1,\2', json_str)
         
         # Fix trailing commas
-        json_str = re.sub(r',\s*(\]|\})', r'\1', json_str)
+        json_str = _TRAILING_COMMA.sub(r'\1', json_str)
         
         # Ensure proper spacing
-        json_str = re.sub(r'\s+', ' ', json_str)
+        json_str = _WS.sub(' ', json_str)
         
         return json_str.strip()
         
     except Exception as e:
-        print(f"Error in fix_json_format: {e}")
+        log.warning("Error in fix_json_format: %s", e)
         return json_str
 
+def _is_clean_keyword(keyword):
+    return isinstance(keyword, str) and keyword != "" and keyword == keyword.strip()
+
+def _is_clean_item(item):
+    """[[start, end], ["keyword", ...]] with numeric times and non-empty, stripped keywords"""
+    return (
+        isinstance(item, list) and len(item) == 2
+        and isinstance(item[0], list) and len(item[0]) == 2
+        and all(isinstance(t, (int, float)) and not isinstance(t, bool) for t in item[0])
+        and isinstance(item[1], list) and item[1]
+        and all(_is_clean_keyword(keyword) for keyword in item[1])
+    )
+
 def validate_and_fix_search_terms(data):
-    """Validate and fix the structure of search terms data."""
+    """
+    Validate and fix the structure of search terms data.
+    Items always come back as ((start, end), (keywords...)): read-only tuples whose repeated
+    keywords share one interned str. Callers only unpack and iterate them.
+    """
     if not isinstance(data, list):
         return []
     
+    # Fast path: a well-formed reply (the usual case) needs no per-keyword repair
+    if all(_is_clean_item(item) for item in data):
+        return [((start, end), tuple(map(sys.intern, keywords))) for (start, end), keywords in data]
+    
     fixed_data = []
     
     for item in data:
@@ -128,19 +250,31 @@ def validate_and_fix_search_terms(data):
             # Clean and validate keywords
             clean_keywords = []
             for keyword in keywords:
-                if isinstance(keyword, str) and keyword.strip():
-                    clean_keywords.append(keyword.strip())
+                if not isinstance(keyword, str) or not keyword:
+                    continue
+                # Most keywords come back trimmed; only strip when an end is whitespace
+                if keyword[0].isspace() or keyword[-1].isspace():
+                    keyword = keyword.strip()
+                    if not keyword:
+                        continue
+                clean_keywords.append(keyword)
             
             # Ensure we have at least one keyword
             if clean_keywords:
-                fixed_data.append([[start_time, end_time], clean_keywords])
+                fixed_data.append(((start_time, end_time), tuple(map(sys.intern, clean_keywords))))
                 
         except Exception as e:
-            print(f"Error processing item: {e}")
+            log.debug("Error processing item: %s", e)
             continue
     
     return fixed_data
 
+class FallbackSearchTerms(list):
+    """
+    Generic search terms returned when the model's reply could not be used.
+    Callers can check isinstance(terms, FallbackSearchTerms) to report it; these are never cached.
+    """
+
 def create_fallback_search_terms(script, captions_timed):
     """Create fallback search terms when AI generation fails."""
     try:
@@ -148,207 +282,377 @@ def create_fallback_search_terms(script, captions_timed):
         
         # Extract key nouns and concepts from the script
         # Simple keyword extraction
-        words = re.findall(r'\b[A-Z][a-z]+\b|\b[a-z]{4,}\b', script)
-        unique_words = list(set(words))[:10]  # Get unique words, limit to 10
+        words = _KEYWORD_RE.findall(script)
+        unique_words = list(dict.fromkeys(words))[:10]  # Unique words in script order, limit to 10
         
         # Create time segments based on captions
         if captions_timed:
             segment_duration = 3.0  # 3 seconds per segment
             total_duration = captions_timed[-1][0][1] if captions_timed else 30.0
             
-            current_time = 0.0
-            word_index = 0
+            # All segment boundaries at once: 0, 3, 6, ... with the last one cut at the end
+            starts = np.arange(0.0, total_duration, segment_duration)
+            ends = np.minimum(starts + segment_duration, total_duration)
             
-            while current_time < total_duration:
-                end_time = min(current_time + segment_duration, total_duration)
-                
-                # Get keywords for this segment
-                keywords = []
-                for i in range(3):  # Try to get 3 keywords
-                    if word_index < len(unique_words):
-                        keywords.append(unique_words[word_index])
-                        word_index += 1
-                    else:
-                        # Fallback to generic terms
-                        generic_terms = ["nature scene", "landscape view", "abstract background"]
-                        keywords.append(generic_terms[i % len(generic_terms)])
-                
-                fallback_terms.append([[current_time, end_time], keywords])
-                current_time = end_time
+            # 3 keywords per segment: script words first, then generic terms
+            generic_terms = ["nature scene", "landscape view", "abstract background"]
+            keywords = [
+                unique_words[slot] if slot < len(unique_words) else generic_terms[slot % 3]
+                for slot in range(len(starts) * 3)
+            ]
+            
+            # Same ((start, end), (keywords...)) shape as validate_and_fix_search_terms
+            fallback_terms = [
+                ((start, end), tuple(keywords[3 * k:3 * k + 3]))
+                for k, (start, end) in enumerate(zip(starts.tolist(), ends.tolist()))
+            ]
         
         else:
             # If no captions, create simple segments
             fallback_terms = [
-                [[0.0, 10.0], ["nature scene", "landscape view", "abstract background"]],
-                [[10.0, 20.0], ["city view", "modern building", "urban scene"]],
-                [[20.0, 30.0], ["sky view", "clouds", "peaceful scene"]]
+                ((0.0, 10.0), ("nature scene", "landscape view", "abstract background")),
+                ((10.0, 20.0), ("city view", "modern building", "urban scene")),
+                ((20.0, 30.0), ("sky view", "clouds", "peaceful scene"))
             ]
         
-        print(f"Created {len(fallback_terms)} fallback search terms")
-        return fallback_terms
+        log.info("Created %d fallback search terms", len(fallback_terms))
+        return FallbackSearchTerms(fallback_terms)
         
     except Exception as e:
-        print(f"Error creating fallback search terms: {e}")
-        return [[[0.0, 30.0], ["nature scene", "landscape view", "peaceful background"]]]
+        log.error("Error creating fallback search terms: %s", e)
+        return FallbackSearchTerms([((0.0, 30.0), ("nature scene", "landscape view", "peaceful background"))])
 
-def getVideoSearchQueriesTimed(script, captions_timed, max_retries=3):
-    """Generate video search queries with robust error handling."""
+# Length of the smallest possible answer, [[[0,1],["a"]]]
+MIN_REPLY_LENGTH = 15
+
+# Seconds to wait for a search-query reply before also sending the next attempt
+# (a failed reply starts the next attempt straight away)
+RETRY_DELAY = 20.0
+
+def parse_search_terms(raw_content, end_time):
+    """
+    Parse the model's reply into [((t1, t2), (keywords...)), ...].
+    Returns None when no strategy yields terms covering the whole video.
+    """
+    log.debug("Raw AI response (first 200 chars): %.200s...", raw_content)
+    # A leading byte-order mark (not removed by strip()) makes every JSON parse fail
+    raw_content = raw_content.lstrip('\ufeff')
     
-    if not captions_timed:
-        print("No captions provided, creating fallback search terms")
-        return create_fallback_search_terms(script, [])
+    # A cut-off reply (rate or length limit) leaves brackets open; no strategy can repair that
+    if len(raw_content) < MIN_REPLY_LENGTH or raw_content.count('[') - raw_content.count(']') > 1:
+        log.warning("⚠️ AI response is too short or cut off, skipping the parsing strategies")
+        return None
     
-    end_time = captions_timed[-1][0][1]
+    # Try multiple parsing strategies, cheapest first. Each one rewrites the reply into
+    # a JSON candidate; a candidate that was already tried is not parsed again.
+    # extract_json_array_from_response and fix_json_format are memoized, so strategy 4
+    # reuses strategy 2's extraction.
+    parsing_strategies = [
+        # Strategy 1: Direct parsing
+        lambda x: x,
+        
+        # Strategy 2: Extract JSON array
+        extract_json_array_from_response,
+        
+        # Strategy 3: Fix formatting
+        fix_json_format,
+        
+        # Strategy 4: Combined extraction and fixing
+        lambda x: fix_json_format(extract_json_array_from_response(x)),
+        
+        # Strategy 5: Replace single quotes (nothing to do without any)
+        lambda x: x.replace("'", '"') if "'" in x else x,
+    ]
     
-    for attempt in range(max_retries):
+    tried = set()
+    for i, strategy in enumerate(parsing_strategies, 1):
         try:
-            print(f"Attempt {attempt + 1}/{max_retries} to generate search queries...")
+            candidate = strategy(raw_content)
+            if candidate in tried:
+                continue
+            tried.add(candidate)
             
-            # Get AI response
-            raw_content = call_OpenAI(script, captions_timed)
-            print(f"Raw AI response (first 200 chars): {raw_content[:200]}...")
+            log.debug("Trying parsing strategy %d...", i)
+            parsed_data = _loads(candidate)
             
-            # Try multiple parsing strategies
-            parsing_strategies = [
-                # Strategy 1: Direct parsing
-                lambda x: json.loads(x),
-                
-                # Strategy 2: Extract and parse JSON array
-                lambda x: json.loads(extract_json_array_from_response(x)),
+            if isinstance(parsed_data, list):
+                # Validate and fix the structure
+                validated_data = validate_and_fix_search_terms(parsed_data)
                 
-                # Strategy 3: Fix formatting and parse
-                lambda x: json.loads(fix_json_format(x)),
-                
-                # Strategy 4: Combined extraction and fixing
-                lambda x: json.loads(fix_json_format(extract_json_array_from_response(x))),
-                
-                # Strategy 5: Replace single quotes and parse
-                lambda x: json.loads(x.replace("'", '"')),
-            ]
-            
-            for i, strategy in enumerate(parsing_strategies, 1):
-                try:
-                    print(f"Trying parsing strategy {i}...")
-                    parsed_data = strategy(raw_content)
+                if validated_data:
+                    # Check if we have coverage for the full duration
+                    last_end = validated_data[-1][0][1] if validated_data else 0
                     
-                    if isinstance(parsed_data, list):
-                        # Validate and fix the structure
-                        validated_data = validate_and_fix_search_terms(parsed_data)
-                        
-                        if validated_data:
-                            # Check if we have coverage for the full duration
-                            last_end = validated_data[-1][0][1] if validated_data else 0
-                            
-                            if abs(last_end - end_time) <= 2.0:  # Allow 2 second tolerance
-                                print(f"✅ Successfully parsed with strategy {i}")
-                                print(f"Generated {len(validated_data)} search term segments")
-                                return validated_data
-                            else:
-                                print(f"⚠️ Strategy {i} parsed but duration mismatch: {last_end} vs {end_time}")
-                        else:
-                            print(f"⚠️ Strategy {i} parsed but validation failed")
+                    if abs(last_end - end_time) <= 2.0:  # Allow 2 second tolerance
+                        log.info("✅ Parsed with strategy %d: %d search term segments", i, len(validated_data))
+                        return validated_data
+                    elif last_end < end_time * 0.5:
+                        # Complete JSON that stops halfway: the other strategies would parse the same data
+                        log.warning("⚠️ Strategy %d parsed but covers only %s of %s seconds", i, last_end, end_time)
+                        return None
                     else:
-                        print(f"⚠️ Strategy {i} didn't return a list")
-                        
-                except json.JSONDecodeError as e:
-                    print(f"❌ Strategy {i} JSON error: {str(e)}")
-                    continue
-                except Exception as e:
-                    print(f"❌ Strategy {i} failed: {str(e)}")
-                    continue
-            
-            print(f"All parsing strategies failed for attempt {attempt + 1}")
-            
-            if attempt < max_retries - 1:
-                print("Retrying with modified prompt...")
-                # You could modify the prompt here for retry
-            
+                        log.debug("⚠️ Strategy %d parsed but duration mismatch: %s vs %s", i, last_end, end_time)
+                else:
+                    log.debug("⚠️ Strategy %d parsed but validation failed", i)
+            else:
+                log.debug("⚠️ Strategy %d didn't return a list", i)
+                
+        except json.JSONDecodeError as e:
+            log.debug("❌ Strategy %d JSON error: %s", i, e)
+            continue
         except Exception as e:
-            print(f"Error in attempt {attempt + 1}: {str(e)}")
+            log.debug("❌ Strategy %d failed: %s", i, e)
+            continue
+    
+    return None
+
+def getVideoSearchQueriesTimed(script, captions_timed, max_retries=3):
+    """Generate video search queries with robust error handling (sync wrapper for scripts like app.py)."""
+    return asyncio.run(getVideoSearchQueriesTimedAsync(script, captions_timed, max_retries))
+
+async def getVideoSearchQueriesTimedAsync(script, captions_timed, max_retries=3):
+    """
+    Generate video search queries with robust error handling.
+    Attempts are staggered: the next one starts when the previous reply fails, or after
+    RETRY_DELAY seconds without a reply. The first reply that parses wins.
+    """
+    
+    if not captions_timed:
+        log.warning("No captions provided, creating fallback search terms")
+        return create_fallback_search_terms(script, [])
+    
+    end_time = captions_timed[-1][0][1]
+    
+    # The search-term cache: replies that parsed, keyed by model + prompt + script + captions
+    # (fallback terms are never stored, so a failed run asks the model again next time)
+    cache_parts = (model, prompt, script, captions_timed)
+    cached_reply = cache_get("search_reply", *cache_parts)
+    if cached_reply is not None:
+        log.debug("Cache hit: search_reply")
+        search_terms = parse_search_terms(cached_reply, end_time)
+        if search_terms:
+            return search_terms
+    
+    # Attempt number of each request in flight
+    attempts = {}
+    
+    def start_attempt():
+        attempt = len(attempts) + 1
+        log.info("Sending search query request %d/%d...", attempt, max_retries)
+        # A little temperature jitter so a retry doesn't fail the same way
+        task = asyncio.ensure_future(call_OpenAI_async(script, captions_timed, temperature=0.2 + 0.1 * attempt))
+        attempts[task] = attempt
+    
+    start_attempt()
+    pending = set(attempts)
+    try:
+        while pending:
+            # Only wait on a timer while there is an attempt left to start
+            timeout = RETRY_DELAY if len(attempts) < max_retries else None
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                log.info("No reply after %s seconds, starting another request", RETRY_DELAY)
+                start_attempt()
+                pending = {task for task in attempts if not task.done()}
+                continue
             
-            if attempt < max_retries - 1:
-                print("Retrying...")
+            for task in done:
+                attempt = attempts[task]
+                try:
+                    raw_content = task.result()
+                except Exception as e:
+                    log.warning("Error in attempt %d/%d: %s", attempt, max_retries, e)
+                else:
+                    search_terms = parse_search_terms(raw_content, end_time)
+                    if search_terms:
+                        cache_set("search_reply", raw_content, *cache_parts)
+                        return search_terms
+                    log.warning("All parsing strategies failed for attempt %d/%d", attempt, max_retries)
+                
+                if len(attempts) < max_retries:
+                    start_attempt()
+            pending = {task for task in attempts if not task.done()}
+    finally:
+        # Requests still running are no longer needed once one reply parses
+        for task in attempts:
+            task.cancel()
             
-    # If all attempts fail, create fallback
-    print("All attempts failed, creating fallback search terms...")
+    log.warning("All attempts failed, creating fallback search terms...")
     return create_fallback_search_terms(script, captions_timed)
 
-def call_OpenAI(script, captions_timed):
+def getVideoSearchQueriesTimedBatch(jobs, max_concurrency=8):
+    """getVideoSearchQueriesTimedBatchAsync for sync callers."""
+    return asyncio.run(getVideoSearchQueriesTimedBatchAsync(jobs, max_concurrency))
+
+async def getVideoSearchQueriesTimedBatchAsync(jobs, max_concurrency=8):
+    """
+    Search queries for many videos at once. jobs is a list of (script, captions_timed)
+    pairs; results come back in the same order. At most max_concurrency videos are in
+    flight (each one runs its own staggered retries).
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def run_job(script, captions_timed):
+        async with semaphore:
+            return await getVideoSearchQueriesTimedAsync(script, captions_timed)
+    
+    return await asyncio.gather(*(run_job(script, captions_timed) for script, captions_timed in jobs))
+
+def search_request(script, captions_timed, temperature=0.3):
+    """Keyword arguments for chat.completions.create, shared by the sync and async paths"""
+    # Compact JSON ([[[t1, t2], "text"], ...]) matches the output format and costs fewer tokens
+    user_content = f"Script: {script}\nTimed Captions: {_dumps(captions_timed)}\n"
+    
+    request = dict(
+        model=model,
+        temperature=temperature,  # Lower temperature for more consistent formatting
+        messages=[
+            # Keep the system prompt first and unchanged so it can be served from the prompt cache
+            SYSTEM_MSG,
+            {"role": "user", "content": user_content}
+        ]
+    )
+    if PROMPT_CACHE_KEY:
+        request["extra_body"] = {"prompt_cache_key": PROMPT_CACHE_KEY}
+    return request
+
+def call_OpenAI(script, captions_timed, temperature=0.3):
     """Call OpenAI API with improved error handling."""
+    return asyncio.run(call_OpenAI_async(script, captions_timed, temperature))
+
+# Replies that have not opened a [ by this many characters are dropped (the prompt asks for JSON only)
+PREAMBLE_LIMIT = 64
+
+async def call_OpenAI_async(script, captions_timed, temperature=0.3):
+    """Call the AI API on the async client with improved error handling."""
     try:
-        user_content = """Script: {}
-Timed Captions:{}
-""".format(script, "".join(map(str, captions_timed)))
-        
-        print("Sending request to AI...")
+        log.debug("Sending request to AI...")
         
-        response = client.chat.completions.create(
-            model=model,
-            temperature=0.3,  # Lower temperature for more consistent formatting
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": user_content}
-            ]
+        stream = await get_async_client(AsyncClient, client.api_key).chat.completions.create(
+            **search_request(script, captions_timed, temperature), stream=True
         )
         
-        text = response.choices[0].message.content.strip()
-        text = re.sub(r'\s+', ' ', text)  # Normalize whitespace
+        # Stop reading (and generating) as soon as the JSON array is complete,
+        # or give up early if the reply does not start with one
+        parts = []
+        received = 0
+        scanner = _BracketScanner()
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ''
+                parts.append(delta)
+                received += len(delta)
+                if scanner is None:
+                    continue
+                end = scanner.feed(delta)
+                if end != -1:
+                    text = ''.join(parts)
+                    try:
+                        _loads(text[scanner.start:received - len(delta) + end + 1])
+                        break
+                    except ValueError:
+                        # Not the real array (or needs fix_json_format): read the whole reply
+                        scanner = None
+                elif not scanner.started and received >= PREAMBLE_LIMIT:
+                    raise Exception(f"No JSON array in the first {PREAMBLE_LIMIT} characters of the reply")
+        finally:
+            await stream.close()
         
-        print("AI response received successfully")
+        # Whitespace is left alone: JSON ignores it between tokens, and odd whitespace
+        # (e.g. non-breaking spaces) is normalized by fix_json_format if parsing needs it
+        text = ''.join(parts).strip()
+        
+        log.debug("AI response received successfully")
         log_response(LOG_TYPE_GPT, script, text)
         
         return text
         
     except Exception as e:
-        print(f"Error calling AI API: {str(e)}")
+        log.debug("Error calling AI API: %s", e)
         raise e
 
+@njit(cache=True, nogil=True)
+def _merge_empty_runs(starts, ends, is_empty, touches_prev):
+    """
+    Interval arithmetic for merge_empty_intervals.
+    touches_prev[i] is True when segment i starts exactly where segment i - 1 ends.
+    Returns, per output interval, the index of the segment whose url it keeps
+    (-1 for None) and its merged start/end.
+    """
+    n = starts.shape[0]
+    out_src = np.empty(n, dtype=np.int32)
+    out_start = np.empty(n, dtype=np.float64)
+    out_end = np.empty(n, dtype=np.float64)
+    k = 0
+    # One pass; while inside a run of None segments, `extending` says whether the run
+    # is being absorbed into the clip before it (True) or was already emitted once (False)
+    extending = False
+    for i in range(n):
+        if not is_empty[i]:
+            out_src[k] = i
+            out_start[k] = starts[i]
+            out_end[k] = ends[i]
+            k += 1
+        elif i > 0 and is_empty[i - 1]:
+            # Rest of a None run: only an extended clip grows, otherwise it is dropped
+            if extending:
+                out_end[k - 1] = ends[i]
+        elif k > 0 and touches_prev[i]:
+            # Extend the previous clip over the None run
+            out_end[k - 1] = ends[i]
+            extending = True
+        else:
+            # First None of a run: repeat the previous clip's url (or None at the start)
+            out_src[k] = out_src[k - 1] if k > 0 else -1
+            out_start[k] = starts[i]
+            out_end[k] = ends[i]
+            k += 1
+            extending = False
+    return out_src[:k], out_start[:k], out_end[:k]
+
 def merge_empty_intervals(segments):
     """Merge empty intervals with improved error handling."""
     try:
         if not segments or not isinstance(segments, list):
             return []
-            
-        merged = []
-        i = 0
         
-        while i < len(segments):
+        # Split the interval arithmetic (compiled) from the url bookkeeping (Python)
+        starts = []
+        ends = []
+        urls = []
+        for i, segment in enumerate(segments):
             try:
-                interval, url = segments[i]
-                
-                if url is None:
-                    # Find consecutive None intervals
-                    j = i + 1
-                    while j < len(segments) and segments[j][1] is None:
-                        j += 1
-                    
-                    # Merge consecutive None intervals with the previous valid URL
-                    if i > 0 and merged:
-                        prev_interval, prev_url = merged[-1]
-                        if prev_url is not None and len(prev_interval) >= 2 and len(interval) >= 2:
-                            if prev_interval[1] == interval[0]:
-                                # Update the last merged interval
-                                end_time = segments[j-1][0][1] if j > i+1 else interval[1]
-                                merged[-1] = [[prev_interval[0], end_time], prev_url]
-                            else:
-                                merged.append([interval, prev_url if merged else None])
-                        else:
-                            merged.append([interval, None])
-                    else:
-                        merged.append([interval, None])
-                    
-                    i = j
-                else:
-                    merged.append([interval, url])
-                    i += 1
-                    
+                interval, url = segment
+                start, end = float(interval[0]), float(interval[1])
             except (IndexError, TypeError, ValueError) as e:
-                print(f"Error processing segment at index {i}: {e}")
-                i += 1
+                log.warning("Error processing segment at index %d: %s", i, e)
                 continue
+            starts.append(start)
+            ends.append(end)
+            urls.append(url)
+        
+        if not urls:
+            return []
+        
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        # Adjacency of neighbouring segments, computed in one vectorized pass
+        touches_prev = np.concatenate(([False], ends[:-1] == starts[1:]))
+        
+        src, merged_starts, merged_ends = _merge_empty_runs(
+            starts,
+            ends,
+            np.asarray([url is None for url in urls], dtype=np.bool_),
+            touches_prev
+        )
         
-        return merged
+        return [
+            [[start, end], urls[index] if index >= 0 else None]
+            for index, start, end in zip(src.tolist(), merged_starts.tolist(), merged_ends.tolist())
+        ]
         
     except Exception as e:
-        print(f"Error in merge_empty_intervals: {e}")
+        log.exception("Error in merge_empty_intervals: %s", e)
         return segments  # Return original if merging fails
@@ -0,0 +1,19 @@
+import logging
+import threading
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+def _warmup():
+    """Compile the Numba kernels on tiny inputs so the first real run doesn't pay for it"""
+    try:
+        from utility.video.video_search_query_generator import _merge_empty_runs
+        starts = np.array([0.0, 1.0], dtype=np.float64)
+        ends = np.array([1.0, 2.0], dtype=np.float64)
+        _merge_empty_runs(starts, ends, np.array([False, True]), np.array([False, True]))
+        log.debug("✅ Numba kernels warmed up")
+    except Exception as e:
+        log.warning("⚠️ Warmup skipped: %s", e)
+
+# Runs once, on first import; cache=True means later processes load the compiled code from disk
+threading.Thread(target=_warmup, name="avcg-warmup", daemon=True).start()